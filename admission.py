@@ -0,0 +1,237 @@
+"""
+同時実行数の制限（アドミッション制御）
+
+PDFの加工処理はCPUを多く使うため、大きなファイルの処理が同時に集中すると
+すべてのCPUコアが埋まり、メタデータ取得などの軽い処理まで遅くなります。
+
+そこで、エンドポイントを処理の重さごとのレーンに分け、レーンごとに次を制限します：
+- 同時に処理するリクエスト数
+- 空きを待つリクエスト数（待ち行列の長さ）と待ち時間
+
+待ち行列が一杯の場合や待ち時間を過ぎた場合は、503 Service Unavailable と Retry-After を返します。
+軽い処理は専用のレーンを使うため、重い処理が混み合っていても待たされません。
+
+制限は Gunicorn の複数のワーカープロセスをまたいで有効になるよう、ロックファイル（flock）で管理します。
+処理中のプロセスが異常終了した場合も、ロックはOSによって自動的に解放されます。
+fcntl が使用できない環境（Windows）では制限を行いません。
+"""
+
+import contextlib
+import functools
+import multiprocessing
+import os
+import time
+
+from flask import g, jsonify, make_response
+
+from storage import ensure_upload_folder
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# 空きを待つ間の確認間隔（秒）
+POLL_INTERVAL = 0.05
+
+class Lane:
+    """
+    同時実行数を制限するレーン
+
+    各設定値は環境変数 <レーン名>_CONCURRENCY、<レーン名>_QUEUE_SIZE、<レーン名>_QUEUE_TIMEOUT
+    （例: HEAVY_CONCURRENCY）で変更できます。
+
+    Args:
+        name (str): レーン名
+        concurrency (int): 同時に処理するリクエスト数
+        queue_size (int): 空きを待つことができるリクエスト数
+        queue_timeout (float): 空きを待つ最大時間（秒）
+    """
+
+    def __init__(self, name, concurrency, queue_size, queue_timeout):
+        self.name = name
+        self.default_concurrency = concurrency
+        self.default_queue_size = queue_size
+        self.default_queue_timeout = queue_timeout
+
+    def setting(self, key, default):
+        """
+        環境変数で変更された設定値を返す関数
+
+        Args:
+            key (str): 設定名（CONCURRENCY、QUEUE_SIZE、QUEUE_TIMEOUT）
+            default: デフォルト値（環境変数の値はこの型に変換されます）
+
+        Returns:
+            設定値
+        """
+        return type(default)(os.environ.get(f'{self.name.upper()}_{key}', default))
+
+    def concurrency(self):
+        """
+        同時に処理するリクエスト数を返す関数
+
+        Returns:
+            int: 環境変数で変更された場合はその値
+        """
+        return self.setting('CONCURRENCY', self.default_concurrency)
+
+    def try_lock(self, kind, count):
+        """
+        ロックファイルのいずれかを取得する関数
+
+        Args:
+            kind (str): 'slot'（処理中）または 'queue'（待ち行列）
+            count (int): ロックファイルの数
+
+        Returns:
+            file: 取得したロックファイル（すべて使用中の場合はNone）
+        """
+        folder = os.path.join(ensure_upload_folder(), '.locks')
+        os.makedirs(folder, exist_ok=True)
+        for index in range(count):
+            lock_file = open(os.path.join(folder, f'{self.name}.{kind}.{index}.lock'), 'a')
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return lock_file
+            except OSError:
+                lock_file.close()
+        return None
+
+    def acquire(self):
+        """
+        レーンの空きを取得する関数
+
+        Returns:
+            file: 取得したロックファイル（release に渡して解放する）
+                  待ち行列が一杯の場合や待ち時間を過ぎた場合はNone
+        """
+        concurrency = self.concurrency()
+        slot = self.try_lock('slot', concurrency)
+        if slot is not None:
+            return slot
+
+        ticket = self.try_lock('queue', self.setting('QUEUE_SIZE', self.default_queue_size))
+        if ticket is None:
+            return None
+
+        try:
+            deadline = time.monotonic() + self.setting('QUEUE_TIMEOUT', self.default_queue_timeout)
+            while time.monotonic() < deadline:
+                time.sleep(POLL_INTERVAL)
+                slot = self.try_lock('slot', concurrency)
+                if slot is not None:
+                    return slot
+            return None
+        finally:
+            self.release(ticket)
+
+    def release(self, lock_file):
+        """
+        取得したロックファイルを解放する関数
+
+        Args:
+            lock_file (file): acquire または try_lock で取得したロックファイル
+        """
+        fcntl.flock(lock_file, fcntl.LOCK_UN)
+        lock_file.close()
+
+# PDFの加工処理（結合・分割・回転・透かしなど）
+# 待っているリクエストもワーカーを占有するため、同時実行数と待ち行列の合計が
+# serve.py のデフォルトのワーカー数（CPUコア数 × 2 + 1）より少なくなるようにしています
+HEAVY_LANE = Lane('heavy', max(1, multiprocessing.cpu_count() - 1), multiprocessing.cpu_count(), 30.0)
+
+# アップロード・メタデータ取得などの軽い処理
+INSPECT_LANE = Lane('inspect', multiprocessing.cpu_count() * 2, multiprocessing.cpu_count() * 4, 10.0)
+
+# 複数ファイルの一括確認
+# 1つのリクエストがプロセスプールでCPUコアを使い切り、結果の送信が終わるまで枠を占有するため、
+# 軽い処理とは別のレーンで同時実行数を絞っています
+BULK_LANE = Lane('bulk', 1, 2, 10.0)
+
+class LaneBusyError(RuntimeError):
+    """
+    処理の途中で別のレーンの空きを取得できなかった場合の例外
+    """
+
+@contextlib.contextmanager
+def lane_slot(lane):
+    """
+    エンドポイントの処理の一部を、別のレーンの空きを取得してから行うためのコンテキストマネージャー
+
+    Args:
+        lane (Lane): 使用するレーン
+
+    Raises:
+        LaneBusyError: 待ち行列が一杯の場合や待ち時間を過ぎた場合
+
+    Note:
+        軽い処理のレーンのエンドポイントで、ファイルによっては重い処理（暗号化PDFの復号など）が
+        必要になる場合に使用します。エンドポイント自体がすでに同じレーンで処理中の場合は、
+        新たに空きを取得しません。
+    """
+    if fcntl is None or g.get('admission_lane') is lane:
+        yield
+        return
+
+    slot = lane.acquire()
+    if slot is None:
+        raise LaneBusyError(lane.name)
+    try:
+        yield
+    finally:
+        lane.release(slot)
+
+def busy_response():
+    """
+    混み合っている場合のレスポンスを返す関数
+
+    Returns:
+        Response: 503 Service Unavailable とエラーメッセージ
+                  （Retry-After は環境変数 ADMISSION_RETRY_AFTER、秒、デフォルト: 5）
+    """
+    response = jsonify({'error': 'サーバーが混み合っています。しばらくしてから再度お試しください。'})
+    response.status_code = 503
+    response.headers['Retry-After'] = os.environ.get('ADMISSION_RETRY_AFTER', '5')
+    return response
+
+def admission_controlled(lane, streaming=False):
+    """
+    エンドポイントにレーンの同時実行数の制限を適用するデコレーター
+
+    Args:
+        lane (Lane): 使用するレーン
+        streaming (bool): Trueの場合、レスポンスの送信中に処理を行うエンドポイント
+                          （ストリーミングレスポンスの送信が終わるまで空きを保持します）
+
+    Returns:
+        function: デコレーター
+
+    Note:
+        混み合っている場合は busy_response（503 と Retry-After）を返します。
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if fcntl is None:
+                return view(*args, **kwargs)
+
+            slot = lane.acquire()
+            if slot is None:
+                return busy_response()
+
+            g.admission_lane = lane
+            try:
+                response = make_response(view(*args, **kwargs))
+            except BaseException:
+                lane.release(slot)
+                raise
+
+            if streaming and response.is_streamed:
+                # 処理は送信中に行われるため、送信が終わるまで空きを保持する
+                response.call_on_close(lambda: lane.release(slot))
+            else:
+                lane.release(slot)
+            return response
+        return wrapper
+    return decorator
@@ -4,10 +4,12 @@ PDF処理ツールキット Web アプリケーション
 このアプリケーションは Flask を使用したPDF処理ツールキットです。
 以下の機能を提供します：
 - PDF結合（複数のPDFファイルを1つに結合）
+- ページ組み立て（複数のPDFから指定したページを指定した順序で1つに組み立て）
 - PDF分割（指定したページ範囲でPDFを分割）
 - PDF回転（特定のページまたは全ページを回転）
 - ページ削除（指定したページをPDFから削除）
 - 透かし追加（PDFや画像を透かしとして追加）
+- サイズ最適化（高解像度の画像を縮小・再圧縮し、不要なオブジェクトを削除）
 - テキスト抽出（PDFからテキストを抽出）
 
 使用技術：
@@ -17,157 +19,153 @@ PDF処理ツールキット Web アプリケーション
 - PIL（画像処理）
 """
 
-import io
+import json
 import os
+from concurrent.futures.process import BrokenProcessPool
 
-from PIL import Image
-from PyPDF2 import PdfReader, PdfWriter, PdfMerger
 from dotenv import load_dotenv
-from flask import Flask, request, render_template, send_file, jsonify
-from reportlab.lib.utils import ImageReader
-from reportlab.pdfgen import canvas
-from werkzeug.utils import secure_filename
+from flask import Blueprint, Flask, request, render_template, jsonify
+
+from admission import BULK_LANE, HEAVY_LANE, INSPECT_LANE, admission_controlled
+from bulk_inspect import inspection_response, max_files
+from chunked_upload import chunked_bp
+from documents import cached_result, decrypted_document_url, documents_bp, send_pdf, upload_document_url
+from encrypted_uploads import decrypted_key, decrypted_uploads, find_decrypted
+from memory_budget import file_size, memory_budgeted, spool_output
+from pdf_operations import (
+    WATERMARK_EXTENSIONS,
+    LinearizationUnavailableError,
+    assemble_document,
+    build_bookkeeping_title,
+    extract_metadata,
+    generate_bookkeeping_filename,
+    insert_document,
+    is_valid_image,
+    is_valid_pdf,
+    merge_documents,
+    parse_assembly_plan,
+    parse_page_ranges,
+    pdf_rewrite_available,
+    remove_pages,
+    rotate_document,
+    set_document_title,
+    split_document,
+    summarize_upload,
+    watermark_document,
+    write_pdf,
+)
+from pdf_optimizer import (
+    DEFAULT_JPEG_QUALITY,
+    DEFAULT_TARGET_DPI,
+    optimization_pool,
+    optimize_document,
+    reset_optimization_pool,
+)
+from storage import find_upload, save_upload
+from streaming_merge import stream_merge_documents
+
+# PyPDF2 / ReportLab / PIL は読み込みに時間がかかるため、
+# モジュール読み込み時ではなく、各関数の中で必要になった時点で import します。
+# PDF処理の本体は pdf_operations モジュールにあり、コマンドラインツールと共有しています。
 
-app = Flask(__name__)
 load_dotenv()
 
-# アップロードされたファイルの保存先
-UPLOAD_FOLDER = 'uploads'
-if not os.path.exists(UPLOAD_FOLDER):
-    os.makedirs(UPLOAD_FOLDER)
+bp = Blueprint('pdf', __name__)
 
-def is_valid_pdf(file):
+def create_app():
     """
-    PDFファイルの妥当性を検証する関数
-    
-    Args:
-        file: アップロードされたファイルオブジェクト
-        
+    Flaskアプリケーションを作成するファクトリ関数
+
     Returns:
-        bool: PDFファイルが有効な場合True、そうでなければFalse
-        
+        Flask: ルートが登録されたアプリケーション
+
     Note:
-        ファイルポインタは関数終了後に先頭に戻されます
+        重いライブラリ（PyPDF2、ReportLab、PIL）はここでは読み込まず、
+        各ルートが最初に必要とした時点で読み込まれます。
     """
-    try:
-        reader = PdfReader(file)
-        # ファイルポインタを先頭に戻す
-        file.seek(0)
-        return True
-    except Exception:
-        return False
+    app = Flask(__name__)
+    app.register_blueprint(bp)
+    app.register_blueprint(chunked_bp)
+    app.register_blueprint(documents_bp)
+    return app
 
-def is_valid_image(file):
+def linearize_requested():
     """
-    画像ファイルの妥当性を検証する関数
-    
-    Args:
-        file: アップロードされたファイルオブジェクト
-        
+    線形化（高速Web表示）した出力が要求されているか判定する関数
+
     Returns:
-        bool: 画像ファイルが有効な場合True、そうでなければFalse
-        
-    Note:
-        ファイルポインタは関数終了後に先頭に戻されます
+        bool: フォームの linearize が 1 / true / on の場合True
     """
-    try:
-        img = Image.open(file)
-        img.verify()
-        # ファイルポインタを先頭に戻す
-        file.seek(0)
-        return True
-    except Exception:
-        return False
+    return request.form.get('linearize', '').lower() in ('1', 'true', 'on')
 
-def create_watermark_pdf_from_image(image_file, page_width, page_height, opacity=0.3):
+def output_options():
     """
-    画像ファイルから透かし用PDFを作成する関数
-    
-    Args:
-        image_file: 透かし用の画像ファイル
-        page_width (float): ページの幅
-        page_height (float): ページの高さ  
-        opacity (float): 透明度（0.0-1.0、デフォルト: 0.3）
-        
+    処理結果の書き出し方法を返す関数
+
     Returns:
-        io.BytesIO: 生成された透かしPDFのバイナリデータ
-        
-    Raises:
-        Exception: 透かしPDFの作成に失敗した場合
-        
+        dict: write_pdf に渡すオプション（linearize: 線形化するか、spool: 一時ファイルに書き出すか、
+              password: 出力を暗号化するパスワード）
+    """
+    return {
+        'linearize': linearize_requested(),
+        'spool': spool_output(),
+        'password': request.form.get('output_password') or None,
+    }
+
+def preload_libraries():
+    """
+    PDF処理で使用する重いライブラリを事前に読み込む関数
+
     Note:
-        画像は指定されたページサイズに合わせてスケーリングされ、
-        中央に配置されます。
+        本番サーバー（serve.py）がワーカーをforkする前に呼び出すことで、
+        読み込んだモジュールのメモリページをワーカー間で共有できます。
     """
-    try:
-        # 画像を開く
-        img = Image.open(image_file)
-        
-        # 透明度を設定（RGBA形式に変換）
-        if img.mode != 'RGBA':
-            img = img.convert('RGBA')
-        
-        # 透明度を調整
-        alpha = img.split()[-1]
-        alpha = alpha.point(lambda p: int(p * opacity))
-        img.putalpha(alpha)
-        
-        # ImageReaderオブジェクトを作成
-        img_buffer = io.BytesIO()
-        img.save(img_buffer, format='PNG')
-        img_buffer.seek(0)
-        img_reader = ImageReader(img_buffer)
-        
-        # PDFを作成
-        pdf_buffer = io.BytesIO()
-        c = canvas.Canvas(pdf_buffer, pagesize=(page_width, page_height))
-        
-        # 画像のサイズを計算（ページサイズに合わせてスケーリング）
-        img_width, img_height = img.size
-        scale_x = page_width / img_width
-        scale_y = page_height / img_height
-        scale = min(scale_x, scale_y) * 0.8  # 少し小さくして余白を作る
-        
-        new_width = img_width * scale
-        new_height = img_height * scale
-        
-        # 中央に配置
-        x = (page_width - new_width) / 2
-        y = (page_height - new_height) / 2
-        
-        # 画像を描画（ImageReaderオブジェクトを使用）
-        c.drawImage(img_reader, x, y, width=new_width, height=new_height, mask='auto')
-        c.save()
-        
-        pdf_buffer.seek(0)
-        return pdf_buffer
-        
-    except Exception as e:
-        raise Exception(f"画像から透かしPDFの作成に失敗しました: {str(e)}")
+    import PIL.Image  # noqa: F401
+    import PyPDF2  # noqa: F401
+    import reportlab.lib.utils  # noqa: F401
+    import reportlab.pdfgen.canvas  # noqa: F401
 
-@app.route('/')
+@bp.route('/')
 def index():
     """
     アプリケーションのメインページを表示
     
     Returns:
         str: レンダリングされたHTMLテンプレート
-    """
-    return render_template('index.html')
 
-@app.route('/upload', methods=['POST'])
+    Note:
+        pikepdf も qpdf コマンドも利用できない場合は、線形化のオプションを表示しません。
+    """
+    return render_template(
+        'index.html',
+        rewrite_available=pdf_rewrite_available(),
+        bulk_inspect_max_files=max_files(),
+    )
+
+@bp.route('/upload', methods=['POST'])
+@admission_controlled(INSPECT_LANE)
+@decrypted_uploads
 def upload_file():
     """
     PDFファイルをアップロードし、基本情報を取得するエンドポイント
     
+    Form Data:
+        file: アップロードするPDFファイル
+        password: パスワードで保護されたPDFのパスワード（任意）
+        
     Returns:
         json: PDFファイルの情報（ページ数、ファイル名、ファイルサイズ）
               またはエラーメッセージ
               
     HTTP Status Codes:
         200: 成功
-        400: ファイル関連のエラー（未選択、不正な形式など）
+        400: ファイル関連のエラー（未選択、不正な形式、パスワードの誤りなど）
         500: サーバー内部エラー
+        503: サーバーが混み合っている（Retry-After 秒後に再試行）
+        
+    Note:
+        パスワードで保護されたPDFは、アップロードフォルダには保存せず、
+        復号した作業用のコピーの配信URL（ファイルとパスワードから計算したキーを含む）を返します。
     """
     try:
         if 'file' not in request.files:
@@ -183,36 +181,88 @@ def upload_file():
         if not is_valid_pdf(file):
             return jsonify({'error': 'PDFファイルの読み込みに失敗しました。ファイルが破損しているか、正しいPDF形式ではありません。'}), 400
         
-        filepath = os.path.join(UPLOAD_FOLDER, secure_filename(file.filename))
-        file.save(filepath)
+        key = decrypted_key(file.stream)
+        if key is not None:
+            # 復号した内容は作業用のコピーにのみ保持し、アップロードフォルダには保存しない
+            info = summarize_upload(find_decrypted(key), file.filename)
+            info['document_url'] = decrypted_document_url(key)
+            return jsonify(info)
+
+        upload_id = save_upload(file)
         
         # PDFの情報を取得
-        reader = PdfReader(filepath)
-        info = {
-            'ページ数': len(reader.pages),
-            'ファイル名': file.filename,
-            'ファイルサイズ': os.path.getsize(filepath)
-        }
+        info = summarize_upload(find_upload(upload_id), file.filename)
+        info['document_url'] = upload_document_url(upload_id)
         return jsonify(info)
     except Exception as e:
         return jsonify({'error': f'PDFの処理中にエラーが発生しました: {str(e)}'}), 500
 
-@app.route('/extract-text', methods=['POST'])
+@bp.route('/bulk-inspect', methods=['POST'])
+@admission_controlled(BULK_LANE, streaming=True)
+def bulk_inspect():
+    """
+    複数のPDFファイルを一括で確認するエンドポイント
+
+    Form Data:
+        files[]: 確認するPDFファイル（複数）
+        password: パスワードで保護されたPDFのパスワード（任意、複数指定可）
+
+    Returns:
+        ndjson: 解析が終わったファイルから順に、1ファイルにつき1行のJSON
+                （index: 送信された順序、filename、status: ok / encrypted / invalid、encrypted、
+                pages、page_sizes: 各ページの [幅, 高さ]（ポイント）、metadata、error）
+        json: エラーメッセージ（失敗時）
+
+    HTTP Status Codes:
+        200: 成功（個々のファイルの読み込みエラーは各行の status と error で返します）
+        400: ファイルが選択されていない
+        413: ファイル数が上限（環境変数 BULK_INSPECT_MAX_FILES、デフォルト: 200）を超えている
+        500: サーバー内部エラー
+        503: サーバーが混み合っている（Retry-After 秒後に再試行）
+
+    Note:
+        ファイルはプロセスプールで並列に解析します（プロセス数は環境変数 BULK_INSPECT_WORKERS）。
+        結果の順序は送信された順序と一致しないため、index で対応づけてください。
+    """
+    try:
+        files = [file for file in request.files.getlist('files[]') if file.filename]
+        if not files:
+            return jsonify({'error': 'ファイルが選択されていません'}), 400
+
+        if len(files) > max_files():
+            return jsonify({'error': f'一度に確認できるファイルは{max_files()}個までです'}), 413
+
+        return inspection_response(files, request.form.getlist('password'))
+    except Exception as e:
+        return jsonify({'error': f'PDFの確認中にエラーが発生しました: {str(e)}'}), 500
+
+@bp.route('/extract-text', methods=['POST'])
+@admission_controlled(HEAVY_LANE)
+@decrypted_uploads
+@memory_budgeted
 def extract_text():
     """
     PDFファイルからテキストを抽出するエンドポイント
     
+    Form Data:
+        file: テキストを抽出するPDFファイル
+        password: パスワードで保護されたPDFのパスワード（任意）
+        
     Returns:
         json: 抽出されたテキスト内容またはエラーメッセージ
         
     HTTP Status Codes:
         200: 成功
         400: ファイル関連のエラー
+        413: ファイルが大きすぎる（メモリ予算を超える）
         500: サーバー内部エラー
+        503: サーバーが混み合っている（Retry-After 秒後に再試行）
         
     Note:
         各ページのテキストが改行で区切られて返されます
     """
+    from PyPDF2 import PdfReader
+
     try:
         if 'file' not in request.files:
             return jsonify({'error': 'ファイルがありません'}), 400
@@ -235,13 +285,21 @@ def extract_text():
     except Exception as e:
         return jsonify({'error': f'テキスト抽出中にエラーが発生しました: {str(e)}'}), 500
 
-@app.route('/merge-pdfs', methods=['POST'])
+@bp.route('/merge-pdfs', methods=['POST'])
+@cached_result
+@admission_controlled(HEAVY_LANE)
+@decrypted_uploads
+@memory_budgeted(streaming=True)
 def merge_pdfs():
     """
     複数のPDFファイルを結合するエンドポイント
     
     Form Data:
         files[]: 結合するPDFファイルの配列（順序が保持されます）
+        merge_mode: streaming の場合、ストリーミング結合（大量・大容量のファイル向け、任意）
+        linearize: 1 の場合、線形化（高速Web表示）したPDFを出力（任意）
+        password: パスワードで保護されたPDFのパスワード（任意）
+        output_password: 指定した場合、出力PDFをこのパスワードで暗号化（任意）
         
     Returns:
         file: 結合されたPDFファイル (merged.pdf)
@@ -250,7 +308,15 @@ def merge_pdfs():
     HTTP Status Codes:
         200: 成功（PDFファイル返却）
         400: ファイル関連のエラー
+        413: ファイルが大きすぎる（メモリ予算を超える）
         500: サーバー内部エラー
+        501: 線形化に必要なツール（pikepdf / qpdf）がない
+        503: サーバーが混み合っている（Retry-After 秒後に再試行）
+        
+    Note:
+        ストリーミング結合では、元のPDFを1つずつ出力に書き込んでから解放するため、
+        メモリ使用量が最も大きい1ファイル分で済みます（しおりは引き継がれません）。
+        メモリ予算が足りない場合は、merge_mode の指定がなくてもストリーミング結合で処理します。
     """
     try:
         if 'files[]' not in request.files:
@@ -267,25 +333,24 @@ def merge_pdfs():
             if not is_valid_pdf(file):
                 return jsonify({'error': f'ファイル "{file.filename}" の読み込みに失敗しました。ファイルが破損しているか、正しいPDF形式ではありません。'}), 400
 
-        merger = PdfMerger()
-        
-        for file in files:
-            merger.append(file)
-        
-        output = io.BytesIO()
-        merger.write(output)
-        output.seek(0)
+        options = output_options()
+        if request.form.get('merge_mode') == 'streaming' or options['spool']:
+            # 元のPDFを1つずつ書き出して解放する（メモリ使用量は最も大きい1ファイル分）
+            output, _ = stream_merge_documents(files, options['linearize'], options['password'])
+        else:
+            output = write_pdf(merge_documents(files), **options)
         
-        return send_file(
-            output,
-            download_name='merged.pdf',
-            as_attachment=True,
-            mimetype='application/pdf'
-        )
+        return send_pdf(output, 'merged.pdf')
+    except LinearizationUnavailableError as e:
+        return jsonify({'error': str(e)}), 501
     except Exception as e:
         return jsonify({'error': f'PDF結合中にエラーが発生しました: {str(e)}'}), 500
 
-@app.route('/split-pdf', methods=['POST'])
+@bp.route('/split-pdf', methods=['POST'])
+@cached_result
+@admission_controlled(HEAVY_LANE)
+@decrypted_uploads
+@memory_budgeted
 def split_pdf():
     """
     PDFファイルを指定したページ範囲で分割するエンドポイント
@@ -293,6 +358,9 @@ def split_pdf():
     Form Data:
         file: 分割対象のPDFファイル
         split_pages: ページ範囲（例: "1-3,5,7-9"）
+        linearize: 1 の場合、線形化（高速Web表示）したPDFを出力（任意）
+        password: パスワードで保護されたPDFのパスワード（任意）
+        output_password: 指定した場合、出力PDFをこのパスワードで暗号化（任意）
         
     Returns:
         file: 分割されたPDFファイル
@@ -301,8 +369,13 @@ def split_pdf():
     HTTP Status Codes:
         200: 成功（PDFファイル返却）
         400: ファイル関連のエラー、無効なページ範囲
+        413: ファイルが大きすぎる（メモリ予算を超える）
         500: サーバー内部エラー
+        501: 線形化に必要なツール（pikepdf / qpdf）がない
+        503: サーバーが混み合っている（Retry-After 秒後に再試行）
     """
+    from PyPDF2 import PdfReader
+
     try:
         if 'file' not in request.files:
             return jsonify({'error': 'ファイルがありません'}), 400
@@ -312,8 +385,6 @@ def split_pdf():
         
         if file.filename == '' or not split_pages_str.strip():
             return jsonify({'error': 'ファイルまたはページ範囲が指定されていません'}), 400
-            
-        page_ranges = split_pages_str.split(',')
 
         if not file.filename.endswith('.pdf'):
             return jsonify({'error': 'PDFファイルのみ対応しています'}), 400
@@ -322,51 +393,32 @@ def split_pdf():
             return jsonify({'error': 'PDFファイルの読み込みに失敗しました。ファイルが破損しているか、正しいPDF形式ではありません。'}), 400
 
         reader = PdfReader(file)
-        writer = PdfWriter()
-        
-        # ページ範囲を解析して有効なページを追加
-        valid_pages = set()
-        for page_range in page_ranges:
-            try:
-                if '-' in page_range:
-                    start, end = map(int, page_range.strip().split('-'))
-                    # 範囲の妥当性チェック
-                    if start < 1 or end > len(reader.pages) or start > end:
-                        continue
-                    valid_pages.update(range(start-1, end))
-                else:
-                    page_num = int(page_range.strip()) - 1
-                    if 0 <= page_num < len(reader.pages):
-                        valid_pages.add(page_num)
-            except ValueError:
-                continue
-        
-        # ページが選択されていない場合はエラー
-        if not valid_pages:
-            return jsonify({'error': '有効なページが指定されていません'}), 400
         
-        # 選択されたページを順番に追加
-        for page_num in sorted(valid_pages):
-            writer.add_page(reader.pages[page_num])
+        # ページ範囲を解析して有効なページを取り出す
+        valid_pages = parse_page_ranges(split_pages_str, len(reader.pages))
+        try:
+            writer = split_document(reader, valid_pages)
+        except ValueError as e:
+            # ページが選択されていない場合はエラー
+            return jsonify({'error': str(e)}), 400
         
-        output = io.BytesIO()
-        writer.write(output)
-        output.seek(0)
+        output = write_pdf(writer, **output_options())
         
         # 元のファイル名を基に新しいファイル名を生成
         original_name = os.path.splitext(file.filename)[0]
         new_filename = f'{original_name}_split.pdf'
         
-        return send_file(
-            output,
-            download_name=new_filename,
-            as_attachment=True,
-            mimetype='application/pdf'
-        )
+        return send_pdf(output, new_filename)
+    except LinearizationUnavailableError as e:
+        return jsonify({'error': str(e)}), 501
     except Exception as e:
         return jsonify({'error': f'PDF分割中にエラーが発生しました: {str(e)}'}), 500
 
-@app.route('/rotate-pdf', methods=['POST'])
+@bp.route('/rotate-pdf', methods=['POST'])
+@cached_result
+@admission_controlled(HEAVY_LANE)
+@decrypted_uploads
+@memory_budgeted
 def rotate_pdf():
     """
     PDFファイルのページを回転するエンドポイント
@@ -376,6 +428,9 @@ def rotate_pdf():
         rotation: 回転角度（90, 180, 270度）
         rotate_type: 回転対象（"all" または "specific"）
         rotate_pages: 特定ページ指定時のページ範囲（例: "1,3,5-7"）
+        linearize: 1 の場合、線形化（高速Web表示）したPDFを出力（任意）
+        password: パスワードで保護されたPDFのパスワード（任意）
+        output_password: 指定した場合、出力PDFをこのパスワードで暗号化（任意）
         
     Returns:
         file: 回転処理されたPDFファイル
@@ -384,8 +439,13 @@ def rotate_pdf():
     HTTP Status Codes:
         200: 成功（PDFファイル返却）
         400: ファイル関連のエラー、無効なパラメータ
+        413: ファイルが大きすぎる（メモリ予算を超える）
         500: サーバー内部エラー
+        501: 線形化に必要なツール（pikepdf / qpdf）がない
+        503: サーバーが混み合っている（Retry-After 秒後に再試行）
     """
+    from PyPDF2 import PdfReader
+
     try:
         if 'file' not in request.files:
             return jsonify({'error': 'ファイルがありません'}), 400
@@ -395,10 +455,6 @@ def rotate_pdf():
         rotate_type = request.form.get('rotate_type', 'all')
         pages = request.form.get('rotate_pages', '')
         
-        # デバッグ情報
-        print(f"回転度数: {rotation}, 回転タイプ: {rotate_type}, ページ: '{pages}'")
-        print(f"受信したフォームデータ: {dict(request.form)}")
-        
         if file.filename == '':
             return jsonify({'error': 'ファイルが選択されていません'}), 400
 
@@ -409,15 +465,10 @@ def rotate_pdf():
             return jsonify({'error': 'PDFファイルの読み込みに失敗しました。ファイルが破損しているか、正しいPDF形式ではありません。'}), 400
 
         reader = PdfReader(file)
-        writer = PdfWriter()
         
         if rotate_type == 'all':
             # すべてのページを回転
-            for i, page in enumerate(reader.pages):
-                # ページのコピーを作成して回転
-                new_page = page
-                new_page = new_page.rotate(rotation)
-                writer.add_page(new_page)
+            writer = rotate_document(reader, rotation)
         else:
             # 特定のページが選択されている場合、ページ指定が必須
             if not pages.strip():
@@ -425,57 +476,33 @@ def rotate_pdf():
                 
             try:
                 # ページ範囲を解析（例: "1-3,5,7-9"）
-                selected_pages = set()
-                for part in pages.split(','):
-                    part = part.strip()
-                    if not part:
-                        continue
-                    if '-' in part:
-                        start, end = map(int, part.split('-'))
-                        if start < 1 or end > len(reader.pages) or start > end:
-                            continue
-                        selected_pages.update(range(start-1, end))
-                    else:
-                        page_num = int(part) - 1
-                        if 0 <= page_num < len(reader.pages):
-                            selected_pages.add(page_num)
-                
-                # 有効なページが選択されているかチェック
-                if not selected_pages:
-                    return jsonify({'error': '有効なページ範囲が指定されていません'}), 400
-                
-                # ページを処理
-                for i in range(len(reader.pages)):
-                    page = reader.pages[i]
-                    if i in selected_pages:
-                        # 選択されたページを回転
-                        new_page = page.rotate(rotation)
-                        writer.add_page(new_page)
-                    else:
-                        # 選択されていないページはそのまま追加
-                        writer.add_page(page)
-                        
+                selected_pages = parse_page_ranges(pages, len(reader.pages), strict=True)
             except ValueError:
                 return jsonify({'error': '無効なページ範囲が指定されました'}), 400
+
+            try:
+                writer = rotate_document(reader, rotation, selected_pages)
+            except ValueError as e:
+                # 有効なページが選択されていない場合
+                return jsonify({'error': str(e)}), 400
         
-        output = io.BytesIO()
-        writer.write(output)
-        output.seek(0)
+        output = write_pdf(writer, **output_options())
         
         # 元のファイル名を基に新しいファイル名を生成
         original_name = os.path.splitext(file.filename)[0]
         new_filename = f'{original_name}_rotated.pdf'
         
-        return send_file(
-            output,
-            download_name=new_filename,
-            as_attachment=True,
-            mimetype='application/pdf'
-        )
+        return send_pdf(output, new_filename)
+    except LinearizationUnavailableError as e:
+        return jsonify({'error': str(e)}), 501
     except Exception as e:
         return jsonify({'error': f'PDF回転中にエラーが発生しました: {str(e)}'}), 500
 
-@app.route('/add-watermark', methods=['POST'])
+@bp.route('/add-watermark', methods=['POST'])
+@cached_result
+@admission_controlled(HEAVY_LANE)
+@decrypted_uploads
+@memory_budgeted
 def add_watermark():
     """
     PDFファイルに透かしを追加するエンドポイント
@@ -483,6 +510,9 @@ def add_watermark():
     Form Data:
         file: 透かしを追加するメインPDFファイル
         watermark: 透かし用ファイル（PDF、PNG、JPG、JPEG、GIF、BMP）
+        linearize: 1 の場合、線形化（高速Web表示）したPDFを出力（任意）
+        password: パスワードで保護されたPDFのパスワード（任意）
+        output_password: 指定した場合、出力PDFをこのパスワードで暗号化（任意）
         
     Returns:
         file: 透かしが追加されたPDFファイル (watermarked.pdf)
@@ -491,12 +521,17 @@ def add_watermark():
     HTTP Status Codes:
         200: 成功（PDFファイル返却）
         400: ファイル関連のエラー、対応していないファイル形式
+        413: ファイルが大きすぎる（メモリ予算を超える）
         500: サーバー内部エラー
+        501: 線形化に必要なツール（pikepdf / qpdf）がない
+        503: サーバーが混み合っている（Retry-After 秒後に再試行）
         
     Note:
         画像ファイルは自動的に透明度0.3で透かしPDFに変換されます。
         各ページのサイズに合わせて透かしがスケーリングされます。
     """
+    from PyPDF2 import PdfReader
+
     try:
         if 'file' not in request.files or 'watermark' not in request.files:
             return jsonify({'error': 'メインファイルまたは透かしファイルがありません'}), 400
@@ -516,73 +551,31 @@ def add_watermark():
 
         # 透かしファイルは画像またはPDF
         watermark_ext = watermark.filename.lower().split('.')[-1]
-        allowed_extensions = ['pdf', 'png', 'jpg', 'jpeg', 'gif', 'bmp']
         
-        if watermark_ext not in allowed_extensions:
+        if watermark_ext not in WATERMARK_EXTENSIONS:
             return jsonify({'error': '透かしファイルはPDF、PNG、JPG、JPEG、GIF、BMP形式のいずれかである必要があります'}), 400
 
-        reader = PdfReader(file)
-        writer = PdfWriter()
-        
-        # 透かしファイルの種類によって処理を分岐
+        # 透かしファイルの種類に応じて妥当性を確認
         if watermark_ext == 'pdf':
-            # PDFファイルの場合（従来の処理）
             if not is_valid_pdf(watermark):
                 return jsonify({'error': '透かしPDFファイルの読み込みに失敗しました。ファイルが破損しているか、正しいPDF形式ではありません。'}), 400
-            
-            watermark_reader = PdfReader(watermark)
-            watermark_page = watermark_reader.pages[0]
-            
-            for page in reader.pages:
-                page.merge_page(watermark_page)
-                writer.add_page(page)
-        else:
-            # 画像ファイルの場合
-            if not is_valid_image(watermark):
-                return jsonify({'error': '透かし画像ファイルの読み込みに失敗しました。ファイルが破損しているか、対応していない形式です。'}), 400
-            
-            # 最初のページのサイズを取得して透かしPDFを作成
-            first_page = reader.pages[0]
-            page_box = first_page.mediabox
-            page_width = float(page_box.width)
-            page_height = float(page_box.height)
-            
-            # 画像から透かしPDFを作成
-            watermark_pdf_buffer = create_watermark_pdf_from_image(watermark, page_width, page_height)
-            watermark_reader = PdfReader(watermark_pdf_buffer)
-            watermark_page = watermark_reader.pages[0]
-            
-            for page in reader.pages:
-                # 各ページのサイズに合わせて透かしを調整
-                current_page_box = page.mediabox
-                current_width = float(current_page_box.width)
-                current_height = float(current_page_box.height)
-                
-                # ページサイズが異なる場合は新しい透かしを作成
-                if abs(current_width - page_width) > 1 or abs(current_height - page_height) > 1:
-                    watermark.seek(0)  # ファイルポインタをリセット
-                    watermark_pdf_buffer = create_watermark_pdf_from_image(watermark, current_width, current_height)
-                    watermark_reader = PdfReader(watermark_pdf_buffer)
-                    watermark_page = watermark_reader.pages[0]
-                    page_width, page_height = current_width, current_height
-                
-                page.merge_page(watermark_page)
-                writer.add_page(page)
-        
-        output = io.BytesIO()
-        writer.write(output)
-        output.seek(0)
+        elif not is_valid_image(watermark):
+            return jsonify({'error': '透かし画像ファイルの読み込みに失敗しました。ファイルが破損しているか、対応していない形式です。'}), 400
+
+        reader = PdfReader(file)
+        output = write_pdf(watermark_document(reader, watermark, watermark_ext), **output_options())
         
-        return send_file(
-            output,
-            download_name='watermarked.pdf',
-            as_attachment=True,
-            mimetype='application/pdf'
-        )
+        return send_pdf(output, 'watermarked.pdf')
+    except LinearizationUnavailableError as e:
+        return jsonify({'error': str(e)}), 501
     except Exception as e:
         return jsonify({'error': f'透かし追加中にエラーが発生しました: {str(e)}'}), 500
 
-@app.route('/delete-pages', methods=['POST'])
+@bp.route('/delete-pages', methods=['POST'])
+@cached_result
+@admission_controlled(HEAVY_LANE)
+@decrypted_uploads
+@memory_budgeted
 def delete_pages():
     """
     PDFファイルから指定したページを削除するエンドポイント
@@ -590,6 +583,9 @@ def delete_pages():
     Form Data:
         file: ページ削除対象のPDFファイル
         delete_pages: 削除するページ範囲（例: "1,3,5-7"）
+        linearize: 1 の場合、線形化（高速Web表示）したPDFを出力（任意）
+        password: パスワードで保護されたPDFのパスワード（任意）
+        output_password: 指定した場合、出力PDFをこのパスワードで暗号化（任意）
         
     Returns:
         file: ページが削除されたPDFファイル
@@ -598,12 +594,17 @@ def delete_pages():
     HTTP Status Codes:
         200: 成功（PDFファイル返却）
         400: ファイル関連のエラー、無効なページ範囲、全ページ削除指定
+        413: ファイルが大きすぎる（メモリ予算を超える）
         500: サーバー内部エラー
+        501: 線形化に必要なツール（pikepdf / qpdf）がない
+        503: サーバーが混み合っている（Retry-After 秒後に再試行）
         
     Note:
         指定されたページ以外のページで新しいPDFが作成されます。
         全ページが削除対象の場合はエラーが返されます。
     """
+    from PyPDF2 import PdfReader
+
     try:
         if 'file' not in request.files:
             return jsonify({'error': 'ファイルがありません'}), 400
@@ -624,61 +625,38 @@ def delete_pages():
             return jsonify({'error': '削除するページが指定されていません'}), 400
 
         reader = PdfReader(file)
-        writer = PdfWriter()
         
         try:
             # 削除するページ番号を解析（例: "1,3,5-7"）
-            pages_to_delete = set()
-            for part in pages.split(','):
-                part = part.strip()
-                if not part:  # 空の部分をスキップ
-                    continue
-                if '-' in part:
-                    start, end = map(int, part.split('-'))
-                    if start < 1 or end > len(reader.pages) or start > end:
-                        continue
-                    pages_to_delete.update(range(start-1, end))
-                else:
-                    try:
-                        page_num = int(part) - 1
-                        if 0 <= page_num < len(reader.pages):
-                            pages_to_delete.add(page_num)
-                    except ValueError:
-                        continue
-
-            if not pages_to_delete:
-                return jsonify({'error': '有効なページ番号が指定されていません'}), 400
-
-            # 指定されたページ以外を追加
-            for i in range(len(reader.pages)):
-                if i not in pages_to_delete:
-                    writer.add_page(reader.pages[i])
-
-            if writer.pages:
-                output = io.BytesIO()
-                writer.write(output)
-                output.seek(0)
-                
-                # 元のファイル名を基に新しいファイル名を生成
-                original_name = os.path.splitext(file.filename)[0]
-                new_filename = f'{original_name}_pages_deleted.pdf'
-                
-                return send_file(
-                    output,
-                    download_name=new_filename,
-                    as_attachment=True,
-                    mimetype='application/pdf'
-                )
-            else:
-                return jsonify({'error': 'すべてのページが削除対象として指定されています'}), 400
-                
+            pages_to_delete = parse_page_ranges(pages, len(reader.pages), strict=True)
         except ValueError:
             return jsonify({'error': '無効なページ番号が指定されました'}), 400
+
+        try:
+            # 指定されたページ以外で新しいPDFを作成
+            writer = remove_pages(reader, pages_to_delete)
+        except ValueError as e:
+            # 有効なページがない場合、または全ページが削除対象の場合
+            return jsonify({'error': str(e)}), 400
+
+        output = write_pdf(writer, **output_options())
+        
+        # 元のファイル名を基に新しいファイル名を生成
+        original_name = os.path.splitext(file.filename)[0]
+        new_filename = f'{original_name}_pages_deleted.pdf'
+        
+        return send_pdf(output, new_filename)
             
+    except LinearizationUnavailableError as e:
+        return jsonify({'error': str(e)}), 501
     except Exception as e:
         return jsonify({'error': f'ページ削除中にエラーが発生しました: {str(e)}'}), 500
 
-@app.route('/insert-pdf', methods=['POST'])
+@bp.route('/insert-pdf', methods=['POST'])
+@cached_result
+@admission_controlled(HEAVY_LANE)
+@decrypted_uploads
+@memory_budgeted
 def insert_pdf():
     """
     PDFファイルの指定した位置に別のPDFファイルを挿入するエンドポイント
@@ -687,6 +665,9 @@ def insert_pdf():
         main_file: メインのPDFファイル
         insert_file: 挿入するPDFファイル
         insert_position: 挿入位置（例: 5 = 5ページ目に挿入）
+        linearize: 1 の場合、線形化（高速Web表示）したPDFを出力（任意）
+        password: パスワードで保護されたPDFのパスワード（任意）
+        output_password: 指定した場合、出力PDFをこのパスワードで暗号化（任意）
         
     Returns:
         file: PDFが挿入された新しいPDFファイル
@@ -695,12 +676,17 @@ def insert_pdf():
     HTTP Status Codes:
         200: 成功（PDFファイル返却）
         400: ファイル関連のエラー、無効な挿入位置
+        413: ファイルが大きすぎる（メモリ予算を超える）
         500: サーバー内部エラー
+        501: 線形化に必要なツール（pikepdf / qpdf）がない
+        503: サーバーが混み合っている（Retry-After 秒後に再試行）
         
     Note:
         挿入位置は1ベースで指定します（1 = 最初のページの前に挿入、2 = 1ページ目と2ページ目の間に挿入）
         メインPDFが10ページの場合、1-11の位置を指定できます
     """
+    from PyPDF2 import PdfReader
+
     try:
         if 'main_file' not in request.files or 'insert_file' not in request.files:
             return jsonify({'error': 'メインファイルまたは挿入ファイルがありません'}), 400
@@ -729,52 +715,199 @@ def insert_pdf():
 
         main_reader = PdfReader(main_file)
         insert_reader = PdfReader(insert_file)
-        writer = PdfWriter()
-        
-        main_pages_count = len(main_reader.pages)
-        
-        # 挿入位置の妥当性チェック（1からメインページ数+1まで）
-        if position < 1 or position > main_pages_count + 1:
-            return jsonify({'error': f'挿入位置は1から{main_pages_count + 1}の範囲で指定してください'}), 400
-
-        # 挿入位置より前のページを追加
-        for i in range(position - 1):
-            writer.add_page(main_reader.pages[i])
-        
-        # 挿入するPDFのすべてのページを追加
-        for page in insert_reader.pages:
-            writer.add_page(page)
         
-        # 挿入位置より後のページを追加
-        for i in range(position - 1, main_pages_count):
-            writer.add_page(main_reader.pages[i])
+        try:
+            writer = insert_document(main_reader, insert_reader, position)
+        except ValueError as e:
+            # 挿入位置が範囲外の場合
+            return jsonify({'error': str(e)}), 400
 
-        output = io.BytesIO()
-        writer.write(output)
-        output.seek(0)
+        output = write_pdf(writer, **output_options())
         
         # 元のファイル名を基に新しいファイル名を生成
         main_name = os.path.splitext(main_file.filename)[0]
-        insert_name = os.path.splitext(insert_file.filename)[0]
         new_filename = f'{main_name}_inserted_at_{position}.pdf'
         
-        return send_file(
-            output,
-            download_name=new_filename,
-            as_attachment=True,
-            mimetype='application/pdf'
-        )
+        return send_pdf(output, new_filename)
             
+    except LinearizationUnavailableError as e:
+        return jsonify({'error': str(e)}), 501
     except Exception as e:
         return jsonify({'error': f'PDF挿入中にエラーが発生しました: {str(e)}'}), 500
 
-@app.route('/get-metadata', methods=['POST'])
+@bp.route('/assemble-pdf', methods=['POST'])
+@cached_result
+@admission_controlled(HEAVY_LANE)
+@decrypted_uploads
+@memory_budgeted
+def assemble_pdf():
+    """
+    複数のPDFから指定したページを指定した順序で組み立てるエンドポイント
+    
+    Form Data:
+        files[]: 元のPDFファイルの配列（plan の doc で1から順に参照します）
+        plan: 組み立ての指示（JSON配列）
+              例: [{"doc": 1, "pages": "1-2"}, {"doc": 2}, {"doc": 3, "pages": "7", "rotation": 90}, {"doc": 1, "pages": "3-"}]
+              doc: 元のPDFの番号（1ベース）
+              pages: ページ範囲（"3-" は3ページ目から最後まで、省略時は全ページ）
+              rotation: 回転角度（90の倍数、省略可）
+        linearize: 1 の場合、線形化（高速Web表示）したPDFを出力（任意）
+        password: パスワードで保護されたPDFのパスワード（任意）
+        output_password: 指定した場合、出力PDFをこのパスワードで暗号化（任意）
+        
+    Returns:
+        file: 組み立てたPDFファイル (assembled.pdf)
+        json: エラーメッセージ（失敗時）
+        
+    HTTP Status Codes:
+        200: 成功（PDFファイル返却）
+        400: ファイル関連のエラー、組み立ての指示の不備
+        413: ファイルが大きすぎる（メモリ予算を超える）
+        500: サーバー内部エラー
+        501: 線形化に必要なツール（pikepdf / qpdf）がない
+        503: サーバーが混み合っている（Retry-After 秒後に再試行）
+        
+    Note:
+        指定されたページをすべて取り出してから、1回の書き出しで組み立てます。
+        同じPDFから取り出したページ間では、フォントや画像などのリソースが共有されます。
+    """
+    from PyPDF2 import PdfReader
+
+    try:
+        if 'files[]' not in request.files:
+            return jsonify({'error': 'ファイルがありません'}), 400
+
+        files = request.files.getlist('files[]')
+        if not files or files[0].filename == '':
+            return jsonify({'error': 'ファイルが選択されていません'}), 400
+
+        # 検証で読み込んだ PdfReader をそのまま組み立てに使用する
+        readers = []
+        for file in files:
+            if not file.filename.endswith('.pdf'):
+                return jsonify({'error': 'すべてのファイルがPDF形式である必要があります'}), 400
+            try:
+                readers.append(PdfReader(file))
+            except Exception:
+                return jsonify({'error': f'ファイル "{file.filename}" の読み込みに失敗しました。ファイルが破損しているか、正しいPDF形式ではありません。'}), 400
+
+        try:
+            plan = json.loads(request.form.get('plan', ''))
+        except ValueError:
+            return jsonify({'error': '組み立ての指示（plan）はJSON配列で指定してください'}), 400
+
+        try:
+            steps = parse_assembly_plan(plan, [len(reader.pages) for reader in readers])
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        output = write_pdf(assemble_document(readers, steps), **output_options())
+        
+        return send_pdf(output, 'assembled.pdf')
+    except LinearizationUnavailableError as e:
+        return jsonify({'error': str(e)}), 501
+    except Exception as e:
+        return jsonify({'error': f'PDF組み立て中にエラーが発生しました: {str(e)}'}), 500
+
+@bp.route('/optimize-pdf', methods=['POST'])
+@cached_result
+@admission_controlled(HEAVY_LANE)
+@decrypted_uploads
+@memory_budgeted
+def optimize_pdf():
+    """
+    PDFファイルのサイズを最適化するエンドポイント
+
+    Form Data:
+        file: 最適化するPDFファイル
+        target_dpi: 目標の解像度（これを超える画像を縮小、任意、デフォルト: 150）
+        jpeg_quality: 再圧縮時のJPEG品質（1-95、任意、デフォルト: 75）
+        linearize: 1 の場合、線形化（高速Web表示）したPDFを出力（任意）
+        password: パスワードで保護されたPDFのパスワード（任意）
+        output_password: 指定した場合、出力PDFをこのパスワードで暗号化（任意）
+
+    Returns:
+        file: 最適化されたPDFファイル
+              （X-Original-Size、X-Optimized-Size ヘッダーに最適化前後のバイト数）
+        json: エラーメッセージ（失敗時）
+
+    HTTP Status Codes:
+        200: 成功（PDFファイル返却）
+        400: ファイル関連のエラー、無効な解像度・品質
+        413: ファイルが大きすぎる（メモリ予算を超える）
+        500: サーバー内部エラー
+        501: 線形化に必要なツール（pikepdf / qpdf）がない
+        503: サーバーが混み合っている（Retry-After 秒後に再試行）
+
+    Note:
+        画像の再圧縮はプロセスプールで並列に行います（プロセス数は環境変数 OPTIMIZE_WORKERS）。
+        再圧縮のプロセスが異常終了した場合は、プロセスプールを作り直して1回だけ再試行します。
+        最適化しても小さくならなかった場合も、処理結果のPDFを返します。
+    """
+    from PyPDF2 import PdfReader
+
+    try:
+        if 'file' not in request.files:
+            return jsonify({'error': 'ファイルがありません'}), 400
+
+        file = request.files['file']
+        if file.filename == '':
+            return jsonify({'error': 'ファイルが選択されていません'}), 400
+
+        if not file.filename.endswith('.pdf'):
+            return jsonify({'error': 'PDFファイルのみ対応しています'}), 400
+
+        if not is_valid_pdf(file):
+            return jsonify({'error': 'PDFファイルの読み込みに失敗しました。ファイルが破損しているか、正しいPDF形式ではありません。'}), 400
+
+        try:
+            target_dpi = int(request.form.get('target_dpi') or DEFAULT_TARGET_DPI)
+            quality = int(request.form.get('jpeg_quality') or DEFAULT_JPEG_QUALITY)
+        except ValueError:
+            return jsonify({'error': '解像度とJPEG品質は数値で指定してください'}), 400
+
+        original_size = file_size(file)
+        for attempt in range(2):
+            pool = optimization_pool()
+            try:
+                writer = optimize_document(PdfReader(file), target_dpi, quality, pool)
+                break
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            except BrokenProcessPool:
+                # 再圧縮のプロセスが異常終了した場合（メモリ不足など）は、プールを作り直して1回だけ再試行する
+                # （途中まで書き換えた画像を使わないよう、PDFは読み込み直す）
+                reset_optimization_pool(pool)
+                file.seek(0)
+                if attempt == 1:
+                    raise
+
+        output = write_pdf(writer, **output_options())
+        optimized_size = output.seek(0, os.SEEK_END)
+        output.seek(0)
+
+        original_name = os.path.splitext(file.filename)[0]
+        new_filename = f'{original_name}_optimized.pdf'
+
+        return send_pdf(output, new_filename, {
+            'X-Original-Size': str(original_size),
+            'X-Optimized-Size': str(optimized_size),
+        })
+    except LinearizationUnavailableError as e:
+        return jsonify({'error': str(e)}), 501
+    except Exception as e:
+        return jsonify({'error': f'PDF最適化中にエラーが発生しました: {str(e)}'}), 500
+
+@bp.route('/get-metadata', methods=['POST'])
+@admission_controlled(INSPECT_LANE)
+@decrypted_uploads
 def get_metadata():
     """
     PDFファイルのメタデータを取得するエンドポイント
     
     Form Data:
         file: メタデータを取得するPDFファイル
+        password: パスワードで保護されたPDFのパスワード（任意）
         
     Returns:
         json: PDFメタデータ情報またはエラーメッセージ
@@ -783,7 +916,10 @@ def get_metadata():
         200: 成功
         400: ファイル関連のエラー
         500: サーバー内部エラー
+        503: サーバーが混み合っている（Retry-After 秒後に再試行）
     """
+    from PyPDF2 import PdfReader
+
     try:
         if 'file' not in request.files:
             return jsonify({'error': 'ファイルがありません'}), 400
@@ -799,28 +935,21 @@ def get_metadata():
             return jsonify({'error': 'PDFファイルの読み込みに失敗しました。ファイルが破損しているか、正しいPDF形式ではありません。'}), 400
         
         reader = PdfReader(file)
-        metadata = reader.metadata
         
         # メタデータを辞書形式で整理
-        metadata_dict = {
-            'title': metadata.get('/Title', '') if metadata else '',
-            'author': metadata.get('/Author', '') if metadata else '',
-            'subject': metadata.get('/Subject', '') if metadata else '',
-            'keywords': metadata.get('/Keywords', '') if metadata else '',
-            'creator': metadata.get('/Creator', '') if metadata else '',
-            'producer': metadata.get('/Producer', '') if metadata else '',
-            'creation_date': str(metadata.get('/CreationDate', '')) if metadata else '',
-            'modification_date': str(metadata.get('/ModDate', '')) if metadata else '',
-            'pages': len(reader.pages),
-            'filename': file.filename
-        }
+        metadata_dict = extract_metadata(reader)
+        metadata_dict['filename'] = file.filename
         
         return jsonify(metadata_dict)
         
     except Exception as e:
         return jsonify({'error': f'メタデータの取得中にエラーが発生しました: {str(e)}'}), 500
 
-@app.route('/edit-metadata', methods=['POST'])
+@bp.route('/edit-metadata', methods=['POST'])
+@cached_result
+@admission_controlled(HEAVY_LANE)
+@decrypted_uploads
+@memory_budgeted
 def edit_metadata():
     """
     PDFファイルのメタデータを編集するエンドポイント（電子帳簿保存法対応）
@@ -831,6 +960,9 @@ def edit_metadata():
         partner: 取引先（例: ㈱あいうえ）
         amount: 金額（例: 100）
         separator: 結合文字（例: -）
+        linearize: 1 の場合、線形化（高速Web表示）したPDFを出力（任意）
+        password: パスワードで保護されたPDFのパスワード（任意）
+        output_password: 指定した場合、出力PDFをこのパスワードで暗号化（任意）
         
     Returns:
         file: メタデータが編集されたPDFファイル
@@ -839,8 +971,13 @@ def edit_metadata():
     HTTP Status Codes:
         200: 成功（PDFファイル返却）
         400: ファイル関連のエラー
+        413: ファイルが大きすぎる（メモリ予算を超える）
         500: サーバー内部エラー
+        501: 線形化に必要なツール（pikepdf / qpdf）がない
+        503: サーバーが混み合っている（Retry-After 秒後に再試行）
     """
+    from PyPDF2 import PdfReader
+
     try:
         if 'file' not in request.files:
             return jsonify({'error': 'ファイルがありません'}), 400
@@ -861,120 +998,26 @@ def edit_metadata():
         amount = request.form.get('amount', '').strip()
         separator = request.form.get('separator', '').strip()
         
-        # 必須フィールドのチェック
-        if not date:
-            return jsonify({'error': '日付を入力してください'}), 400
-        if not partner:
-            return jsonify({'error': '取引先を入力してください'}), 400
-        if not amount:
-            return jsonify({'error': '金額を入力してください'}), 400
-        if not separator:
-            return jsonify({'error': '結合文字を入力してください'}), 400
-        
-        # ファイル名を構築
-        title = f"{date}{separator}{partner}{separator}{amount}"
+        # 必須フィールドのチェックとファイル名の構築
+        try:
+            title = build_bookkeeping_title(date, partner, amount, separator)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
         reader = PdfReader(file)
-        writer = PdfWriter()
-        
-        # 全ページをコピー
-        for page in reader.pages:
-            writer.add_page(page)
-        
-        # 既存のメタデータを保持しつつ、タイトルのみを更新
-        existing_metadata = reader.metadata or {}
-        metadata = {}
-        
-        # 既存のメタデータを保持
-        for key, value in existing_metadata.items():
-            if key != '/Title':  # タイトル以外は既存の値を保持
-                metadata[key] = value
-        
-        # タイトルを更新
-        metadata['/Title'] = title
-        
-        # 現在の日時を更新日として設定
-        from datetime import datetime
-        metadata['/ModDate'] = datetime.now().strftime("D:%Y%m%d%H%M%S")
-        
-        writer.add_metadata(metadata)
-        
-        output = io.BytesIO()
-        writer.write(output)
-        output.seek(0)
+        output = write_pdf(set_document_title(reader, title), **output_options())
         
         # タイトルをファイル名として使用（安全な文字に変換）
-        import re
-        
-        # 安全でない文字を削除または置換
-        safe_title = re.sub(r'[<>:"/\\|?*]', '', title)
-        safe_title = safe_title.strip()
+        new_filename = generate_bookkeeping_filename(title, file.filename)
         
-        # 空の場合は元のファイル名を使用
-        if not safe_title:
-            safe_title = os.path.splitext(file.filename)[0]
-        
-        # 長すぎる場合は短縮
-        if len(safe_title) > 200:
-            safe_title = safe_title[:200]
-            
-        new_filename = f"{safe_title}.pdf"
-        
-        # デバッグ情報を出力
-        print(f"元のタイトル: {title}")
-        print(f"安全なタイトル: {safe_title}")
-        print(f"新しいファイル名: {new_filename}")
-        
-        # 一時ファイルを作成してから送信
-        import tempfile
-        import uuid
-        
-        # 一時ファイルを作成
-        temp_dir = tempfile.gettempdir()
-        temp_id = str(uuid.uuid4())
-        temp_path = os.path.join(temp_dir, f"{temp_id}.pdf")
-        
-        # 一時ファイルにPDFを保存
-        with open(temp_path, 'wb') as temp_file:
-            temp_file.write(output.getvalue())
-        
-        # ファイル送信後に削除するためのコールバック
-        def remove_file(response):
-            try:
-                os.remove(temp_path)
-            except Exception:
-                pass
-            return response
-        
-        # 日本語ファイル名を適切にエンコード
-        import urllib.parse
-        encoded_filename = urllib.parse.quote(new_filename.encode('utf-8'))
-        
-        # レスポンスを作成
-        response = send_file(
-            temp_path,
-            as_attachment=True,
-            mimetype='application/pdf'
-        )
-        
-        # Content-Dispositionヘッダーを明示的に設定（日本語対応）
-        # 日本語文字が含まれる場合は、filename*パラメータのみを使用
-        try:
-            # ASCII文字のみかチェック
-            new_filename.encode('ascii')
-            # ASCII文字のみの場合は通常のfilename
-            response.headers['Content-Disposition'] = f'attachment; filename="{new_filename}"'
-        except UnicodeEncodeError:
-            # 日本語文字が含まれる場合は、filename*のみを使用
-            response.headers['Content-Disposition'] = f'attachment; filename*=UTF-8\'\'{encoded_filename}'
-        
-        # ファイル削除のコールバックを追加
-        response.call_on_close(lambda: remove_file(response))
-        
-        return response
+        return send_pdf(output, new_filename)
         
+    except LinearizationUnavailableError as e:
+        return jsonify({'error': str(e)}), 501
     except Exception as e:
         return jsonify({'error': f'メタデータの編集中にエラーが発生しました: {str(e)}'}), 500
 
+app = create_app()
+
 if __name__ == '__main__':
     app.run(debug=True) 
\ No newline at end of file
@@ -0,0 +1,104 @@
+"""
+起動時間ベンチマーク
+
+新しい Python プロセスを毎回起動し、以下の時間を計測します：
+- app モジュールの import 時間
+- create_app() によるアプリケーション作成時間
+- 最初のリクエスト（/ と /get-metadata）の処理時間
+- 参考値: PyPDF2 / ReportLab / PIL を事前に読み込んだ場合の import 時間
+
+使用例：
+    python bench_startup.py --runs 10
+"""
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import click
+
+# 子プロセスで実行する計測コード
+CHILD_CODE = r'''
+import io
+import json
+import time
+
+t0 = time.perf_counter()
+import app as app_module
+t1 = time.perf_counter()
+flask_app = app_module.create_app()
+t2 = time.perf_counter()
+client = flask_app.test_client()
+client.get('/')
+t3 = time.perf_counter()
+client.post('/get-metadata', data={'file': (io.BytesIO(PDF_BYTES), 'bench.pdf')})
+t4 = time.perf_counter()
+app_module.preload_libraries()
+t5 = time.perf_counter()
+print(json.dumps({
+    'import_app': t1 - t0,
+    'create_app': t2 - t1,
+    'first_index': t3 - t2,
+    'first_metadata': t4 - t3,
+    'preload_libraries': t5 - t4,
+}))
+'''
+
+# 1ページの最小PDF（/get-metadata の計測用）
+MINIMAL_PDF = (
+    b'%PDF-1.4\n'
+    b'1 0 obj<</Type/Catalog/Pages 2 0 R>>endobj\n'
+    b'2 0 obj<</Type/Pages/Kids[3 0 R]/Count 1>>endobj\n'
+    b'3 0 obj<</Type/Page/Parent 2 0 R/MediaBox[0 0 595 842]>>endobj\n'
+    b'trailer<</Root 1 0 R>>\n%%EOF\n'
+)
+
+
+def run_once():
+    """
+    新しいプロセスで1回計測する関数
+
+    Returns:
+        dict: 各段階の所要時間（秒）とプロセス全体の所要時間
+    """
+    code = f'PDF_BYTES = {MINIMAL_PDF!r}\n' + CHILD_CODE
+    started = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, '-c', code],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    timings = json.loads(completed.stdout.strip().splitlines()[-1])
+    timings['process_total'] = time.perf_counter() - started
+    return timings
+
+
+@click.command()
+@click.option('--runs', '-n', type=int, default=10, show_default=True, help='計測回数')
+def main(runs):
+    """
+    アプリケーションの起動時間を計測して中央値を表示する
+    """
+    results = [run_once() for _ in range(runs)]
+
+    labels = [
+        ('import_app', 'import app'),
+        ('create_app', 'create_app()'),
+        ('first_index', '最初の GET /'),
+        ('first_metadata', '最初の POST /get-metadata'),
+        ('preload_libraries', 'preload_libraries()（残りの重いライブラリ）'),
+        ('process_total', 'プロセス全体'),
+    ]
+    click.echo(f'🌻 起動時間ベンチマーク（{runs}回の中央値）')
+    for key, label in labels:
+        median = statistics.median(result[key] for result in results)
+        click.echo(f'  {median * 1000:8.1f} ms  {label}')
+
+
+if __name__ == '__main__':
+    main()
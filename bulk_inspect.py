@@ -0,0 +1,179 @@
+"""
+複数ファイルの一括確認
+
+結合のために数百のPDFをまとめて選択した場合、/upload や /get-metadata を1ファイルずつ
+呼び出すと、その数だけリクエストが発生します。一括確認では、1つのリクエストで受け取ったファイルを
+一時ファイルに書き出し、プロセスプールで並列に解析します。
+
+解析が終わったファイルから順に、1行に1つのJSON（NDJSON）で結果を返すため、
+画面では解析が終わったものから表示を更新できます。結果の順序は送信された順序と一致しないため、
+各行の index（送信された順序、0から）で対応づけます。
+パスワードで保護されたPDFは、password で復号できない場合もエラーにせず、status: encrypted として返します。
+
+1つのリクエストで受け付けるファイル数には上限があり、一括確認は専用のレーン（BULK_LANE）で
+同時実行数を制限します。プロセスプールの大きさは、レーンの同時実行数で CPU コアを分け合うように決めます。
+"""
+
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+from flask import Response
+
+from admission import BULK_LANE
+from pdf_operations import inspect_document
+from storage import ensure_upload_folder
+
+# 1つのリクエストで受け付けるファイル数のデフォルト
+DEFAULT_MAX_FILES = 200
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def max_files():
+    """
+    1つのリクエストで受け付けるファイル数の上限を返す関数
+
+    Returns:
+        int: 環境変数 BULK_INSPECT_MAX_FILES（デフォルト: 200）の値
+    """
+    return int(os.environ.get('BULK_INSPECT_MAX_FILES', DEFAULT_MAX_FILES))
+
+def inspection_pool():
+    """
+    解析に使用するプロセスプールを返す関数
+
+    Returns:
+        ProcessPoolExecutor: プロセスプール（最初に使用した時点で作成されます）
+
+    Note:
+        プロセス数は環境変数 BULK_INSPECT_WORKERS（デフォルト: CPUコア数 ÷ BULK_LANE の同時実行数）で指定します。
+        プールは Gunicorn のワーカーごとに作成されますが、同時に解析を行うのはレーンの同時実行数までのため、
+        解析に使うプロセスの合計はCPUコア数程度に収まります。
+    """
+    global _pool
+
+    with _pool_lock:
+        if _pool is None:
+            default = multiprocessing.cpu_count() // BULK_LANE.concurrency()
+            workers = int(os.environ.get('BULK_INSPECT_WORKERS', default))
+            _pool = ProcessPoolExecutor(max_workers=max(1, workers))
+        return _pool
+
+def reset_inspection_pool(pool):
+    """
+    異常終了したワーカーを含むプロセスプールを破棄する関数
+
+    Args:
+        pool (ProcessPoolExecutor): 破棄するプロセスプール（次回の使用時に新しく作成されます）
+    """
+    global _pool
+
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def spool_uploads(files):
+    """
+    アップロードされたファイルをワーカープロセスから読める一時ファイルに書き出す関数
+
+    Args:
+        files (list): アップロードされたファイルオブジェクトのリスト
+
+    Returns:
+        tuple: (一時フォルダのパス, 各ファイルの一時ファイルのパスのリスト)
+    """
+    folder = os.path.join(ensure_upload_folder(), '.bulk')
+    os.makedirs(folder, exist_ok=True)
+    temp_dir = tempfile.mkdtemp(dir=folder)
+    paths = []
+    for index, file in enumerate(files):
+        path = os.path.join(temp_dir, f'{index}.pdf')
+        file.save(path)
+        paths.append(path)
+    return temp_dir, paths
+
+def inspection_response(files, passwords):
+    """
+    アップロードされたファイルを並列に解析し、終わったものから結果を返すレスポンスを作成する関数
+
+    Args:
+        files (list): アップロードされたファイルオブジェクトのリスト
+        passwords (list): 暗号化されたPDFに試行するパスワードのリスト
+
+    Returns:
+        Response: 1ファイルにつき1行のJSONを返すストリーミングレスポンス（application/x-ndjson）
+
+    Note:
+        一時ファイルへの書き出しと解析の開始はこの関数の中で行い、結果はレスポンスの送信中に返します。
+        一時ファイルは、レスポンスの送信が終わった時点（途中で接続が切れた場合も含む）で削除し、
+        まだ始まっていない解析は取り消します。
+    """
+    temp_dir, paths = spool_uploads(files)
+    pool = inspection_pool()
+    rejected = []
+    futures = {}
+    try:
+        for index, (file, path) in enumerate(zip(files, paths)):
+            if not file.filename.lower().endswith('.pdf'):
+                rejected.append(record(index, file.filename, status='invalid', error='PDFファイルのみ対応しています'))
+                continue
+            futures[pool.submit(inspect_document, path, passwords)] = (index, file.filename)
+    except Exception:
+        cancel_inspection(futures, temp_dir)
+        raise
+
+    def generate():
+        yield from rejected
+        for future in as_completed(futures):
+            index, filename = futures[future]
+            try:
+                yield record(index, filename, **future.result())
+            except BrokenProcessPool:
+                reset_inspection_pool(pool)
+                yield record(index, filename, status='invalid', error='PDFの解析中にワーカープロセスが異常終了しました')
+            except Exception as e:
+                yield record(index, filename, status='invalid', error=f'PDFの解析中にエラーが発生しました: {str(e)}')
+
+    response = Response(generate(), mimetype='application/x-ndjson')
+    # 途中まで受信した結果を表示できるよう、プロキシでのバッファリングを無効にする
+    response.headers['X-Accel-Buffering'] = 'no'
+    response.call_on_close(lambda: cancel_inspection(futures, temp_dir))
+    return response
+
+def cancel_inspection(futures, temp_dir):
+    """
+    まだ始まっていない解析を取り消し、一時ファイルを削除する関数
+
+    Args:
+        futures (dict): 解析中の Future
+        temp_dir (str): 一時フォルダのパス
+    """
+    for future in futures:
+        future.cancel()
+    shutil.rmtree(temp_dir, ignore_errors=True)
+
+def record(index, filename, **info):
+    """
+    1ファイル分の結果をNDJSONの1行に変換する関数
+
+    Args:
+        index (int): 送信された順序（0から）
+        filename (str): アップロード時のファイル名
+        **info: inspect_document の戻り値（status、encrypted、pages、page_sizes、metadata、error）
+
+    Returns:
+        str: 改行で終わるJSON文字列
+    """
+    info.setdefault('encrypted', False)
+    info.setdefault('pages', None)
+    info.setdefault('page_sizes', [])
+    info.setdefault('metadata', {})
+    info.setdefault('error', None)
+    return json.dumps({'index': index, 'filename': filename, **info}, ensure_ascii=False) + '\n'
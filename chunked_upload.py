@@ -0,0 +1,375 @@
+"""
+分割（チャンク）アップロード
+
+大きなPDFを複数のチャンクに分けてアップロードするためのエンドポイントです。
+通信が途切れても、受信済みのチャンクはそのまま残るため、途中から再開できます。
+
+プロトコル：
+1. POST /upload/chunked                      アップロードを開始（upload_id を発行）
+2. PUT  /upload/chunked/<upload_id>/<index>  チャンクを送信（X-Chunk-SHA256 ヘッダーでチェックサムを指定）
+3. GET  /upload/chunked/<upload_id>          受信済みチャンクの確認（再開時に使用）
+4. POST /upload/chunked/<upload_id>/complete チャンクを結合して /upload と同じ保存先に保存
+                                             （パスワードで保護されたPDFはフォームの password で復号）
+
+チャンクはメモリに溜めずにそのままディスクに書き込みます。
+受信状態はディスク上に保存されるため、複数のワーカープロセスで処理しても問題ありません。
+"""
+
+import hashlib
+import json
+import os
+import re
+import shutil
+import time
+import uuid
+
+from flask import Blueprint, request, jsonify
+
+from admission import INSPECT_LANE, LaneBusyError, admission_controlled, busy_response
+from documents import decrypted_document_url, upload_document_url
+from encrypted_uploads import decrypted_key, find_decrypted, open_decrypted
+from pdf_operations import is_encrypted_pdf, summarize_upload
+from storage import ensure_upload_folder, find_upload, move_upload
+
+chunked_bp = Blueprint('chunked_upload', __name__)
+
+# 1チャンクの最大サイズ
+MAX_CHUNK_SIZE = 64 * 1024 * 1024
+
+# ディスクへの書き込み・結合時の読み込み単位
+COPY_BUFFER_SIZE = 1024 * 1024
+
+# upload_id として受け付ける形式（パストラバーサル対策）
+UPLOAD_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+def chunk_folder():
+    """
+    チャンクの一時保存先を返す関数
+
+    Returns:
+        str: アップロードフォルダ内のチャンク保存用フォルダのパス
+    """
+    path = os.path.join(ensure_upload_folder(), '.chunks')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+def upload_dir(upload_id):
+    """
+    指定したアップロードのチャンク保存先を返す関数
+
+    Args:
+        upload_id (str): アップロードID
+
+    Returns:
+        str: 保存先のパス（IDの形式が不正な場合やアップロードが存在しない場合はNone）
+    """
+    if not UPLOAD_ID_PATTERN.match(upload_id):
+        return None
+    path = os.path.join(chunk_folder(), upload_id)
+    if not os.path.isdir(path):
+        return None
+    return path
+
+def load_manifest(path):
+    """
+    アップロードの情報（ファイル名、サイズ、チャンクサイズなど）を読み込む関数
+
+    Args:
+        path (str): チャンク保存先のパス
+
+    Returns:
+        dict: アップロードの情報
+    """
+    with open(os.path.join(path, 'manifest.json'), encoding='utf-8') as f:
+        return json.load(f)
+
+def received_chunks(path, manifest):
+    """
+    受信済みのチャンク番号を返す関数
+
+    Args:
+        path (str): チャンク保存先のパス
+        manifest (dict): アップロードの情報
+
+    Returns:
+        list: 受信済みのチャンク番号（昇順）
+    """
+    return [index for index in range(manifest['total_chunks'])
+            if os.path.exists(os.path.join(path, f'{index}.part'))]
+
+def expected_chunk_size(manifest, index):
+    """
+    指定したチャンクの本来のサイズを返す関数
+
+    Args:
+        manifest (dict): アップロードの情報
+        index (int): チャンク番号
+
+    Returns:
+        int: チャンクのバイト数（最後のチャンクは残りのサイズ）
+    """
+    if index < manifest['total_chunks'] - 1:
+        return manifest['chunk_size']
+    return manifest['size'] - manifest['chunk_size'] * (manifest['total_chunks'] - 1)
+
+def remove_expired_uploads():
+    """
+    有効期限を過ぎた未完了のアップロードを削除する関数
+
+    Note:
+        有効期限は環境変数 CHUNKED_UPLOAD_TTL（秒、デフォルト: 86400）で指定します。
+    """
+    ttl = int(os.environ.get('CHUNKED_UPLOAD_TTL', 24 * 60 * 60))
+    folder = chunk_folder()
+    now = time.time()
+    for name in os.listdir(folder):
+        path = os.path.join(folder, name)
+        try:
+            if now - os.path.getmtime(path) > ttl:
+                shutil.rmtree(path, ignore_errors=True)
+        except OSError:
+            continue
+
+@chunked_bp.route('/upload/chunked', methods=['POST'])
+def init_chunked_upload():
+    """
+    分割アップロードを開始するエンドポイント
+
+    JSON Body:
+        filename: アップロードするファイル名
+        size: ファイル全体のバイト数
+        chunk_size: 1チャンクのバイト数
+
+    Returns:
+        json: upload_id、チャンクサイズ、チャンク数、受信済みチャンク
+              またはエラーメッセージ
+
+    HTTP Status Codes:
+        200: 成功
+        400: パラメータの不備
+        500: サーバー内部エラー
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        filename = data.get('filename', '')
+
+        if not filename:
+            return jsonify({'error': 'ファイル名が指定されていません'}), 400
+
+        if not filename.endswith('.pdf'):
+            return jsonify({'error': 'PDFファイルのみ対応しています'}), 400
+
+        try:
+            size = int(data.get('size', 0))
+            chunk_size = int(data.get('chunk_size', 0))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'サイズは数値で指定してください'}), 400
+
+        if size <= 0:
+            return jsonify({'error': 'ファイルサイズが正しくありません'}), 400
+
+        if chunk_size <= 0 or chunk_size > MAX_CHUNK_SIZE:
+            return jsonify({'error': f'チャンクサイズは1から{MAX_CHUNK_SIZE}バイトの範囲で指定してください'}), 400
+
+        remove_expired_uploads()
+
+        upload_id = uuid.uuid4().hex
+        path = os.path.join(chunk_folder(), upload_id)
+        os.makedirs(path)
+
+        manifest = {
+            'filename': filename,
+            'size': size,
+            'chunk_size': chunk_size,
+            'total_chunks': (size + chunk_size - 1) // chunk_size,
+        }
+        with open(os.path.join(path, 'manifest.json'), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False)
+
+        return jsonify({
+            'upload_id': upload_id,
+            'chunk_size': chunk_size,
+            'total_chunks': manifest['total_chunks'],
+            'received': [],
+        })
+    except Exception as e:
+        return jsonify({'error': f'アップロードの開始中にエラーが発生しました: {str(e)}'}), 500
+
+@chunked_bp.route('/upload/chunked/<upload_id>', methods=['GET'])
+def chunked_upload_status(upload_id):
+    """
+    分割アップロードの受信状況を返すエンドポイント（再開時に使用）
+
+    Returns:
+        json: upload_id、チャンクサイズ、チャンク数、受信済みチャンク
+              またはエラーメッセージ
+
+    HTTP Status Codes:
+        200: 成功
+        404: アップロードが存在しない（期限切れを含む）
+    """
+    path = upload_dir(upload_id)
+    if path is None:
+        return jsonify({'error': 'アップロードが見つかりません'}), 404
+
+    manifest = load_manifest(path)
+    return jsonify({
+        'upload_id': upload_id,
+        'chunk_size': manifest['chunk_size'],
+        'total_chunks': manifest['total_chunks'],
+        'received': received_chunks(path, manifest),
+    })
+
+@chunked_bp.route('/upload/chunked/<upload_id>/<int:index>', methods=['PUT'])
+def upload_chunk(upload_id, index):
+    """
+    チャンクを1つ受信するエンドポイント
+
+    Headers:
+        X-Chunk-SHA256: チャンク内容のSHA-256（16進数）
+
+    Request Body:
+        チャンクのバイナリデータ
+
+    Returns:
+        json: 受信したチャンク番号と受信済みチャンク数
+              またはエラーメッセージ
+
+    HTTP Status Codes:
+        200: 成功
+        400: チャンク番号・サイズ・チェックサムの不一致
+        404: アップロードが存在しない（期限切れを含む）
+        500: サーバー内部エラー
+
+    Note:
+        チャンクは一時ファイルに書き込み、チェックサムを確認してから確定します。
+        同じチャンクを再送した場合は上書きされます。
+    """
+    try:
+        path = upload_dir(upload_id)
+        if path is None:
+            return jsonify({'error': 'アップロードが見つかりません'}), 404
+
+        manifest = load_manifest(path)
+        if index < 0 or index >= manifest['total_chunks']:
+            return jsonify({'error': f'チャンク番号は0から{manifest["total_chunks"] - 1}の範囲で指定してください'}), 400
+
+        expected_checksum = request.headers.get('X-Chunk-SHA256', '').lower()
+        if not expected_checksum:
+            return jsonify({'error': 'チェックサム（X-Chunk-SHA256）が指定されていません'}), 400
+
+        expected_size = expected_chunk_size(manifest, index)
+        temp_path = os.path.join(path, f'{index}.tmp.{uuid.uuid4().hex}')
+        digest = hashlib.sha256()
+        written = 0
+
+        # リクエスト本文をメモリに溜めずにディスクへ書き込む
+        try:
+            with open(temp_path, 'wb') as f:
+                while True:
+                    block = request.stream.read(COPY_BUFFER_SIZE)
+                    if not block:
+                        break
+                    written += len(block)
+                    if written > expected_size:
+                        break
+                    digest.update(block)
+                    f.write(block)
+
+            if written != expected_size:
+                return jsonify({'error': f'チャンク {index} のサイズが正しくありません（期待値: {expected_size}バイト）'}), 400
+
+            if digest.hexdigest() != expected_checksum:
+                return jsonify({'error': f'チャンク {index} のチェックサムが一致しません'}), 400
+
+            os.replace(temp_path, os.path.join(path, f'{index}.part'))
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+        # 最終更新時刻を更新して有効期限を延長
+        os.utime(path)
+
+        return jsonify({
+            'index': index,
+            'received': len(received_chunks(path, manifest)),
+            'total_chunks': manifest['total_chunks'],
+        })
+    except Exception as e:
+        return jsonify({'error': f'チャンクの受信中にエラーが発生しました: {str(e)}'}), 500
+
+@chunked_bp.route('/upload/chunked/<upload_id>/complete', methods=['POST'])
+@admission_controlled(INSPECT_LANE)
+def complete_chunked_upload(upload_id):
+    """
+    受信したチャンクを結合して保存するエンドポイント
+
+    Form Data:
+        password: パスワードで保護されたPDFのパスワード（任意）
+
+    Returns:
+        json: /upload と同じPDFファイルの情報（ページ数、ファイル名、ファイルサイズ）
+              またはエラーメッセージ
+
+    HTTP Status Codes:
+        200: 成功
+        400: 未受信のチャンクがある、PDFとして読み込めない、パスワードの誤り
+        404: アップロードが存在しない（期限切れを含む）
+        500: サーバー内部エラー
+        503: サーバーが混み合っている（Retry-After 秒後に再試行）
+    """
+    from PyPDF2 import PdfReader
+
+    try:
+        path = upload_dir(upload_id)
+        if path is None:
+            return jsonify({'error': 'アップロードが見つかりません'}), 404
+
+        manifest = load_manifest(path)
+        received = received_chunks(path, manifest)
+        if len(received) != manifest['total_chunks']:
+            missing = sorted(set(range(manifest['total_chunks'])) - set(received))
+            return jsonify({'error': '未受信のチャンクがあります', 'missing': missing}), 400
+
+        # チャンクを順番に結合（ファイル単位でコピーするため、メモリ使用量は一定）
+        assembled_path = os.path.join(path, 'assembled.pdf')
+        with open(assembled_path, 'wb') as out:
+            for index in range(manifest['total_chunks']):
+                with open(os.path.join(path, f'{index}.part'), 'rb') as chunk:
+                    shutil.copyfileobj(chunk, out, COPY_BUFFER_SIZE)
+
+        try:
+            PdfReader(assembled_path)
+        except Exception:
+            shutil.rmtree(path, ignore_errors=True)
+            return jsonify({'error': 'PDFファイルの読み込みに失敗しました。ファイルが破損しているか、正しいPDF形式ではありません。'}), 400
+
+        # パスワードで保護されたPDFは /upload と同じく作業用のコピーにのみ復号する
+        # （パスワードの誤りの場合はチャンクを残し、正しいパスワードで再度完了できるようにする）
+        with open(assembled_path, 'rb') as assembled:
+            if is_encrypted_pdf(assembled):
+                try:
+                    decrypted = open_decrypted(assembled, request.form.getlist('password'))
+                except ValueError as e:
+                    return jsonify({'error': f'ファイル "{manifest["filename"]}": {str(e)}'}), 400
+                except LaneBusyError:
+                    return busy_response()
+                decrypted.close()
+                key = decrypted_key(decrypted)
+            else:
+                key = None
+        if key is not None:
+            shutil.rmtree(path, ignore_errors=True)
+            info = summarize_upload(find_decrypted(key), manifest['filename'])
+            info['document_url'] = decrypted_document_url(key)
+            return jsonify(info)
+
+        # /upload と同じ保存先に移動
+        document_id = move_upload(assembled_path)
+        shutil.rmtree(path, ignore_errors=True)
+
+        info = summarize_upload(find_upload(document_id), manifest['filename'])
+        info['document_url'] = upload_document_url(document_id)
+        return jsonify(info)
+    except Exception as e:
+        return jsonify({'error': f'PDFの処理中にエラーが発生しました: {str(e)}'}), 500
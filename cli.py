@@ -0,0 +1,492 @@
+"""
+PDF処理ツールキット コマンドラインツール
+
+Web アプリケーションと同じ処理（pdf_operations モジュール）を、HTTPを介さずに
+ディレクトリ単位で一括実行します。夜間バッチなどでの利用を想定しています。
+
+特徴：
+- 入力ディレクトリ以下を再帰的に処理し、出力ディレクトリに同じ構成で保存
+- ファイルをプロセスプールで並列処理
+- 処理結果をジャーナルに記録し、--resume で失敗・未処理のものだけを再実行
+- 終了時にスループット（ファイル数、ページ数、MB/秒）を表示
+
+使用例：
+    python cli.py split ./input ./output --pages 1-3
+    python cli.py rotate ./input ./output --rotation 90 --pages 1,3
+    python cli.py merge ./input ./output --jobs 8
+    python cli.py merge ./input ./output --streaming
+    python cli.py rename ./input ./output --mapping invoices.csv --resume
+    python cli.py optimize ./input ./output --dpi 150
+"""
+
+import csv
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import click
+
+from pdf_operations import (
+    WATERMARK_EXTENSIONS,
+    build_bookkeeping_title,
+    generate_bookkeeping_filename,
+    insert_document,
+    merge_documents,
+    parse_page_ranges,
+    remove_pages,
+    rotate_document,
+    set_document_title,
+    split_document,
+    watermark_document,
+    write_pdf,
+)
+from pdf_optimizer import DEFAULT_JPEG_QUALITY, DEFAULT_TARGET_DPI, optimize_document
+from streaming_merge import stream_merge_documents
+
+# 処理結果を記録するジャーナルファイル（出力ディレクトリ直下に作成）
+JOURNAL_FILENAME = '.sunflower_batch.jsonl'
+
+def find_pdfs(input_dir):
+    """
+    入力ディレクトリ以下のPDFファイルを再帰的に探す関数
+
+    Args:
+        input_dir (str): 入力ディレクトリ
+
+    Returns:
+        list: 入力ディレクトリからの相対パスのリスト（ソート済み）
+    """
+    found = []
+    for root, dirs, files in os.walk(input_dir):
+        dirs.sort()
+        for name in sorted(files):
+            if name.lower().endswith('.pdf'):
+                found.append(os.path.relpath(os.path.join(root, name), input_dir))
+    return found
+
+def build_writer(operation, params, inputs):
+    """
+    操作名とパラメータに応じて pdf_operations の関数を呼び出す関数
+
+    Args:
+        operation (str): 操作名（merge、split、rotate、delete、insert、watermark、rename、optimize）
+        params (dict): 操作のパラメータ
+        inputs (list): 入力PDFのパス
+
+    Returns:
+        tuple: (PdfWriter または PdfMerger, 入力ページ数)
+    """
+    from PyPDF2 import PdfReader
+
+    if operation == 'merge':
+        page_count = sum(len(PdfReader(path).pages) for path in inputs)
+        return merge_documents(inputs), page_count
+
+    reader = PdfReader(inputs[0])
+    page_count = len(reader.pages)
+
+    if operation == 'split':
+        pages = parse_page_ranges(params['pages'], page_count)
+        return split_document(reader, pages), page_count
+    if operation == 'rotate':
+        pages = None
+        if params['pages']:
+            pages = parse_page_ranges(params['pages'], page_count, strict=True)
+        return rotate_document(reader, params['rotation'], pages), page_count
+    if operation == 'delete':
+        pages = parse_page_ranges(params['pages'], page_count, strict=True)
+        return remove_pages(reader, pages), page_count
+    if operation == 'insert':
+        return insert_document(reader, PdfReader(params['insert_file']), params['position']), page_count
+    if operation == 'watermark':
+        ext = params['watermark'].lower().split('.')[-1]
+        with open(params['watermark'], 'rb') as watermark:
+            return watermark_document(reader, watermark, ext), page_count
+    if operation == 'rename':
+        return set_document_title(reader, params['title']), page_count
+    if operation == 'optimize':
+        return optimize_document(reader, params['dpi'], params['quality']), page_count
+    raise ValueError(f'不明な操作です: {operation}')
+
+def run_task(operation, params, inputs, output):
+    """
+    1件の処理を実行する関数（ワーカープロセスで実行されます）
+
+    Args:
+        operation (str): 操作名
+        params (dict): 操作のパラメータ
+        inputs (list): 入力PDFのパス
+        output (str): 出力PDFのパス
+
+    Returns:
+        dict: 入力ページ数、入力バイト数、出力バイト数
+
+    Note:
+        出力は一時ファイルに書き込んでから置き換えるため、
+        途中で失敗しても壊れた出力ファイルは残りません。
+    """
+    if operation == 'merge' and params.get('streaming'):
+        return run_streaming_merge(params, inputs, output)
+
+    writer, page_count = build_writer(operation, params, inputs)
+
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    temp_output = f'{output}.part'
+    try:
+        with open(temp_output, 'wb') as f:
+            if params.get('linearize'):
+                f.write(write_pdf(writer, linearize=True).getbuffer())
+            else:
+                writer.write(f)
+        os.replace(temp_output, output)
+    except Exception:
+        if os.path.exists(temp_output):
+            os.remove(temp_output)
+        raise
+
+    return {
+        'pages': page_count,
+        'bytes_in': sum(os.path.getsize(path) for path in inputs),
+        'bytes_out': os.path.getsize(output),
+    }
+
+def run_streaming_merge(params, inputs, output):
+    """
+    ストリーミング結合で1件の結合を実行する関数（ワーカープロセスで実行されます）
+
+    Args:
+        params (dict): 操作のパラメータ
+        inputs (list): 入力PDFのパス
+        output (str): 出力PDFのパス
+
+    Returns:
+        dict: run_task と同じ入力ページ数、入力バイト数、出力バイト数
+
+    Note:
+        入力PDFを1つずつ書き出して解放するため、数百ファイルの結合でも
+        メモリ使用量は最も大きい1ファイル分で済みます。
+    """
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    temp_output = f'{output}.part'
+    try:
+        merged, page_count = stream_merge_documents(inputs, linearize=params.get('linearize'))
+        with merged, open(temp_output, 'wb') as f:
+            shutil.copyfileobj(merged, f)
+        os.replace(temp_output, output)
+    except Exception:
+        if os.path.exists(temp_output):
+            os.remove(temp_output)
+        raise
+
+    return {
+        'pages': page_count,
+        'bytes_in': sum(os.path.getsize(path) for path in inputs),
+        'bytes_out': os.path.getsize(output),
+    }
+
+def params_fingerprint(operation, params):
+    """
+    操作とパラメータから、再開判定用のフィンガープリントを作成する関数
+
+    Args:
+        operation (str): 操作名
+        params (dict): 操作のパラメータ
+
+    Returns:
+        str: フィンガープリント（16進数）
+    """
+    payload = json.dumps([operation, params], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+def load_journal(journal_path):
+    """
+    ジャーナルから完了済みの出力を読み込む関数
+
+    Args:
+        journal_path (str): ジャーナルファイルのパス
+
+    Returns:
+        set: (出力の相対パス, フィンガープリント) の集合
+    """
+    done = set()
+    if not os.path.exists(journal_path):
+        return done
+    with open(journal_path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue  # 書き込み途中で中断された行は無視
+            if entry.get('status') == 'done':
+                done.add((entry['output'], entry['fingerprint']))
+    return done
+
+def run_batch(operation, tasks, output_dir, jobs, resume, linearize=False):
+    """
+    タスクを並列実行し、結果をジャーナルに記録してサマリーを表示する関数
+
+    Args:
+        operation (str): 操作名
+        tasks (list): (入力パスのリスト, 出力の相対パス, パラメータ) のリスト
+        output_dir (str): 出力ディレクトリ
+        jobs (int): 並列プロセス数
+        resume (bool): Trueの場合、ジャーナルで完了済みのタスクをスキップ
+        linearize (bool): Trueの場合、線形化（高速Web表示）したPDFを出力
+
+    Returns:
+        int: 失敗したタスクの数
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    journal_path = os.path.join(output_dir, JOURNAL_FILENAME)
+    done = load_journal(journal_path) if resume else set()
+
+    pending = []
+    skipped = 0
+    for inputs, output_rel, params in tasks:
+        params = dict(params, linearize=linearize)
+        fingerprint = params_fingerprint(operation, params)
+        if (output_rel, fingerprint) in done and os.path.exists(os.path.join(output_dir, output_rel)):
+            skipped += 1
+            continue
+        pending.append((inputs, output_rel, params, fingerprint))
+
+    totals = {'pages': 0, 'bytes_in': 0, 'bytes_out': 0}
+    failures = []
+    started = time.perf_counter()
+
+    with open(journal_path, 'a' if resume else 'w', encoding='utf-8') as journal:
+        def record(output_rel, fingerprint, result=None, error=None):
+            entry = {'output': output_rel, 'fingerprint': fingerprint,
+                     'status': 'failed' if error else 'done'}
+            if error:
+                entry['error'] = error
+                failures.append((output_rel, error))
+                click.echo(f'  ✗ {output_rel}: {error}', err=True)
+            else:
+                for key in totals:
+                    totals[key] += result[key]
+                click.echo(f'  ✓ {output_rel}')
+            journal.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            journal.flush()
+
+        if jobs == 1:
+            for inputs, output_rel, params, fingerprint in pending:
+                try:
+                    result = run_task(operation, params, inputs, os.path.join(output_dir, output_rel))
+                except Exception as e:
+                    record(output_rel, fingerprint, error=str(e))
+                else:
+                    record(output_rel, fingerprint, result=result)
+        else:
+            with ProcessPoolExecutor(max_workers=jobs) as executor:
+                futures = {
+                    executor.submit(run_task, operation, params, inputs,
+                                    os.path.join(output_dir, output_rel)): (output_rel, fingerprint)
+                    for inputs, output_rel, params, fingerprint in pending
+                }
+                for future in as_completed(futures):
+                    output_rel, fingerprint = futures[future]
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        record(output_rel, fingerprint, error=str(e))
+                    else:
+                        record(output_rel, fingerprint, result=result)
+
+    elapsed = time.perf_counter() - started
+    completed = len(pending) - len(failures)
+    mb_in = totals['bytes_in'] / (1024 * 1024)
+    mb_out = totals['bytes_out'] / (1024 * 1024)
+
+    def rate(value):
+        return value / elapsed if elapsed > 0 else 0.0
+
+    click.echo('')
+    click.echo('🌻 処理サマリー')
+    click.echo(f'  完了: {completed}件 / 失敗: {len(failures)}件 / スキップ（完了済み）: {skipped}件')
+    click.echo(f'  ページ数: {totals["pages"]} / 入力: {mb_in:.1f} MB / 出力: {mb_out:.1f} MB')
+    click.echo(f'  所要時間: {elapsed:.1f} 秒（{jobs}プロセス）')
+    click.echo(f'  スループット: {rate(completed):.2f} ファイル/秒, '
+               f'{rate(totals["pages"]):.1f} ページ/秒, {rate(mb_in):.2f} MB/秒')
+    if failures:
+        click.echo('  失敗したファイルは --resume を付けて再実行すると再処理されます', err=True)
+    return len(failures)
+
+def per_file_tasks(input_dir, suffix, params):
+    """
+    入力PDF1件ごとに1件のタスクを作成する関数
+
+    Args:
+        input_dir (str): 入力ディレクトリ
+        suffix (str): 出力ファイル名に付ける接尾辞（例: _split）
+        params (dict): 操作のパラメータ
+
+    Returns:
+        list: run_batch に渡すタスクのリスト
+    """
+    tasks = []
+    for rel in find_pdfs(input_dir):
+        output_rel = f'{os.path.splitext(rel)[0]}{suffix}.pdf'
+        tasks.append(([os.path.join(input_dir, rel)], output_rel, params))
+    return tasks
+
+def finish(failed):
+    """
+    失敗があった場合に終了コード1で終了する関数
+    """
+    if failed:
+        sys.exit(1)
+
+def common_options(command):
+    """
+    全コマンド共通の引数とオプションを追加するデコレータ
+    """
+    command = click.argument('output_dir', type=click.Path(file_okay=False))(command)
+    command = click.argument('input_dir', type=click.Path(exists=True, file_okay=False))(command)
+    command = click.option('--jobs', '-j', type=click.IntRange(min=1), default=os.cpu_count() or 1,
+                           show_default='CPUコア数', help='並列プロセス数')(command)
+    command = click.option('--resume', is_flag=True,
+                           help='前回の実行で完了したファイルをスキップして再開する')(command)
+    command = click.option('--linearize', is_flag=True,
+                           help='線形化（高速Web表示）したPDFを出力する（pikepdf または qpdf が必要）')(command)
+    return command
+
+@click.group()
+def cli():
+    """
+    🌻 Sunflower PDF Toolkit コマンドラインツール
+    """
+
+@cli.command()
+@common_options
+@click.option('--output-name', default=None, help='結合結果のファイル名（既定: ディレクトリ名.pdf）')
+@click.option('--streaming', is_flag=True,
+              help='1ファイルずつ書き出してメモリ使用量を抑える（しおりは引き継がれません）')
+def merge(input_dir, output_dir, jobs, resume, linearize, output_name, streaming):
+    """
+    ディレクトリごとにPDFをファイル名順に結合する
+    """
+    groups = {}
+    for rel in find_pdfs(input_dir):
+        groups.setdefault(os.path.dirname(rel), []).append(os.path.join(input_dir, rel))
+
+    tasks = []
+    for rel_dir, inputs in sorted(groups.items()):
+        name = output_name or f'{os.path.basename(os.path.abspath(os.path.join(input_dir, rel_dir)))}.pdf'
+        params = {'inputs': [os.path.basename(p) for p in inputs], 'streaming': streaming}
+        tasks.append((inputs, os.path.join(rel_dir, name), params))
+    finish(run_batch('merge', tasks, output_dir, jobs, resume, linearize))
+
+@cli.command()
+@common_options
+@click.option('--pages', '-p', required=True, help='取り出すページ範囲（例: 1-3,5）')
+def split(input_dir, output_dir, jobs, resume, linearize, pages):
+    """
+    各PDFから指定ページを取り出す
+    """
+    tasks = per_file_tasks(input_dir, '_split', {'pages': pages})
+    finish(run_batch('split', tasks, output_dir, jobs, resume, linearize))
+
+@cli.command()
+@common_options
+@click.option('--rotation', '-r', type=click.Choice(['90', '180', '270']), default='90',
+              show_default=True, help='回転角度')
+@click.option('--pages', '-p', default='', help='回転するページ範囲（省略時は全ページ）')
+def rotate(input_dir, output_dir, jobs, resume, linearize, rotation, pages):
+    """
+    各PDFのページを回転する
+    """
+    tasks = per_file_tasks(input_dir, '_rotated', {'rotation': int(rotation), 'pages': pages})
+    finish(run_batch('rotate', tasks, output_dir, jobs, resume, linearize))
+
+@cli.command()
+@common_options
+@click.option('--pages', '-p', required=True, help='削除するページ範囲（例: 1,3,5-7）')
+def delete(input_dir, output_dir, jobs, resume, linearize, pages):
+    """
+    各PDFから指定ページを削除する
+    """
+    tasks = per_file_tasks(input_dir, '_pages_deleted', {'pages': pages})
+    finish(run_batch('delete', tasks, output_dir, jobs, resume, linearize))
+
+@cli.command()
+@common_options
+@click.option('--insert-file', required=True, type=click.Path(exists=True, dir_okay=False),
+              help='挿入するPDFファイル')
+@click.option('--position', type=click.IntRange(min=1), required=True,
+              help='挿入位置（1ベース、1 = 最初のページの前）')
+def insert(input_dir, output_dir, jobs, resume, linearize, insert_file, position):
+    """
+    各PDFの指定位置に別のPDFを挿入する
+    """
+    params = {'insert_file': os.path.abspath(insert_file), 'position': position}
+    tasks = per_file_tasks(input_dir, f'_inserted_at_{position}', params)
+    finish(run_batch('insert', tasks, output_dir, jobs, resume, linearize))
+
+@cli.command()
+@common_options
+@click.option('--watermark', required=True, type=click.Path(exists=True, dir_okay=False),
+              help='透かし用ファイル（PDF、PNG、JPG、JPEG、GIF、BMP）')
+def watermark(input_dir, output_dir, jobs, resume, linearize, watermark):
+    """
+    各PDFに透かしを追加する
+    """
+    if watermark.lower().split('.')[-1] not in WATERMARK_EXTENSIONS:
+        raise click.BadParameter('透かしファイルはPDF、PNG、JPG、JPEG、GIF、BMP形式のいずれかである必要があります')
+    tasks = per_file_tasks(input_dir, '_watermarked', {'watermark': os.path.abspath(watermark)})
+    finish(run_batch('watermark', tasks, output_dir, jobs, resume, linearize))
+
+@cli.command()
+@common_options
+@click.option('--dpi', type=click.IntRange(min=1), default=DEFAULT_TARGET_DPI, show_default=True,
+              help='目標の解像度（これを超える画像を縮小）')
+@click.option('--quality', type=click.IntRange(1, 95), default=DEFAULT_JPEG_QUALITY, show_default=True,
+              help='再圧縮時のJPEG品質')
+def optimize(input_dir, output_dir, jobs, resume, linearize, dpi, quality):
+    """
+    各PDFの画像を縮小・再圧縮してファイルサイズを小さくする
+
+    画像の再圧縮は各ファイルを処理するプロセスの中で行います（並列数は --jobs）。
+    """
+    tasks = per_file_tasks(input_dir, '_optimized', {'dpi': dpi, 'quality': quality})
+    finish(run_batch('optimize', tasks, output_dir, jobs, resume, linearize))
+
+@cli.command()
+@common_options
+@click.option('--mapping', required=True, type=click.Path(exists=True, dir_okay=False),
+              help='filename,date,partner,amount 列を持つCSVファイル')
+@click.option('--separator', default='-', show_default=True, help='結合文字')
+def rename(input_dir, output_dir, jobs, resume, linearize, mapping, separator):
+    """
+    CSVの内容に従って電帳法対応のファイル名とタイトルを設定する
+
+    filename 列には入力ディレクトリからの相対パスを指定します。
+    """
+    with open(mapping, encoding='utf-8-sig', newline='') as f:
+        rows = {os.path.normpath(row['filename']): row for row in csv.DictReader(f)}
+
+    tasks = []
+    unmapped = 0
+    for rel in find_pdfs(input_dir):
+        row = rows.get(os.path.normpath(rel))
+        if row is None:
+            unmapped += 1
+            continue
+        try:
+            title = build_bookkeeping_title(row['date'].strip(), row['partner'].strip(),
+                                            row['amount'].strip(), separator)
+        except ValueError as e:
+            raise click.ClickException(f'{rel}: {e}')
+        output_rel = os.path.join(os.path.dirname(rel), generate_bookkeeping_filename(title, rel))
+        tasks.append(([os.path.join(input_dir, rel)], output_rel, {'title': title}))
+
+    if unmapped:
+        click.echo(f'CSVに記載のないファイル {unmapped}件 はスキップします', err=True)
+    finish(run_batch('rename', tasks, output_dir, jobs, resume, linearize))
+
+if __name__ == '__main__':
+    cli()
@@ -0,0 +1,296 @@
+"""
+保存済みドキュメントの配信
+
+アップロードされたPDFと処理結果のPDFを、HTTP Range リクエスト（206 Partial Content）、
+ETag、Accept-Ranges に対応した形で配信します。
+
+PDF.js は Range リクエストに対応したサーバーから読み込む場合、表示するページに
+必要な部分だけを取得するため、大きなPDFでも最初のページがすぐに表示されます。
+
+処理系のエンドポイントの結果は result_cache モジュールでキャッシュされ、
+同じ入力・同じパラメータの再実行時は処理を行わずにキャッシュから返します。
+
+エンドポイント：
+- GET /documents/uploads/<upload_id>   アップロードされたPDF
+- GET /documents/decrypted/<key>       パスワードで保護されたPDFの作業用のコピー
+- GET /documents/outputs/<document_id> 処理結果のPDF（?download=1 で添付ファイルとして送信）
+"""
+
+import functools
+import urllib.parse
+
+from flask import Blueprint, Response, g, jsonify, request, send_file, url_for
+
+from encrypted_uploads import find_decrypted
+from result_cache import cache_budget, find_result, request_cache_key, store_result
+from storage import find_output, find_upload, save_output
+
+documents_bp = Blueprint('documents', __name__)
+
+# 処理結果をダウンロードせずにURLで受け取る場合に指定するヘッダー
+RESPONSE_MODE_HEADER = 'X-Response-Mode'
+
+def wants_document_response():
+    """
+    クライアントが処理結果をURLで受け取ることを希望しているか判定する関数
+
+    Returns:
+        bool: X-Response-Mode: document ヘッダーが指定されている場合True
+    """
+    return request.headers.get(RESPONSE_MODE_HEADER, '').lower() == 'document'
+
+def upload_document_url(upload_id):
+    """
+    アップロードされたPDFの配信URLを返す関数
+
+    Args:
+        upload_id (str): save_upload / move_upload が返すアップロードのID
+
+    Returns:
+        str: 配信URL
+    """
+    return url_for('documents.serve_upload', upload_id=upload_id)
+
+def decrypted_document_url(key):
+    """
+    パスワードで保護されたPDFの作業用のコピーの配信URLを返す関数
+
+    Args:
+        key (str): decrypted_key が返す作業用のコピーのキー
+
+    Returns:
+        str: 配信URL
+    """
+    return url_for('documents.serve_decrypted', key=key)
+
+def document_response(output, download_name):
+    """
+    処理結果を保存し、プレビュー用・ダウンロード用のURLを返す関数
+
+    Args:
+        output: 処理結果のPDF（io.BytesIO または一時ファイル）
+        download_name (str): ダウンロード時のファイル名
+
+    Returns:
+        json: document_url（プレビュー用）、download_url（ダウンロード用）、filename
+    """
+    document_id = save_output(output, download_name)
+    return jsonify({
+        'document_url': url_for('documents.serve_output', document_id=document_id),
+        'download_url': url_for('documents.serve_output', document_id=document_id, download=1),
+        'filename': download_name,
+    })
+
+def attachment_disposition(filename):
+    """
+    添付ファイルとして送信する場合の Content-Disposition ヘッダーの値を返す関数
+
+    Args:
+        filename (str): ダウンロード時のファイル名
+
+    Returns:
+        str: Content-Disposition ヘッダーの値
+
+    Note:
+        日本語文字が含まれる場合は、filename*パラメータのみを使用します。
+    """
+    try:
+        # ASCII文字のみの場合は通常のfilename
+        filename.encode('ascii')
+        return f'attachment; filename="{filename}"'
+    except UnicodeEncodeError:
+        encoded_filename = urllib.parse.quote(filename.encode('utf-8'))
+        return f"attachment; filename*=UTF-8''{encoded_filename}"
+
+def cached_result(view):
+    """
+    処理系のエンドポイントに処理結果のキャッシュを適用するデコレーター
+
+    Args:
+        view (function): send_pdf で処理結果を返すエンドポイント関数
+
+    Returns:
+        function: キャッシュに処理結果があればそれを返し、なければ元の関数を呼び出す関数
+
+    Note:
+        キャッシュにない場合、キャッシュキーを保存しておき、send_pdf が処理結果をキャッシュに保存します。
+        エラー時のレスポンスはキャッシュしません。
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if cache_budget() <= 0:
+            return view(*args, **kwargs)
+
+        key = request_cache_key()
+        cached = find_result(key)
+        if cached is not None:
+            return send_cached_result(cached)
+
+        g.result_cache_key = key
+        return view(*args, **kwargs)
+    return wrapper
+
+def send_cached_result(cached):
+    """
+    キャッシュされた処理結果を返す関数
+
+    Args:
+        cached (tuple): find_result が返す (PDFファイルの絶対パス, ダウンロード時のファイル名, ETag, 追加のレスポンスヘッダー)
+
+    Returns:
+        Response: X-Response-Mode: document が指定された場合はURLを含むJSON、
+                  If-None-Match が一致した場合は 304 Not Modified、
+                  それ以外の場合は強いETag付きのPDFファイル（添付ファイル）
+    """
+    path, download_name, etag, headers = cached
+    if wants_document_response():
+        with open(path, 'rb') as f:
+            response = document_response(f, download_name)
+    # POSTリクエストでは send_file の条件付きレスポンスが使えないため、ここで判定する
+    elif request.if_none_match.contains(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+    else:
+        response = send_file(path, mimetype='application/pdf', etag=etag)
+        response.headers['Content-Disposition'] = attachment_disposition(download_name)
+    response.headers.update(headers)
+    return response
+
+def send_pdf(output, download_name, headers=None):
+    """
+    処理結果のPDFを返す関数
+
+    Args:
+        output: 処理結果のPDF（io.BytesIO または一時ファイル）
+        download_name (str): ダウンロード時のファイル名
+        headers (dict): 処理結果と一緒に返すレスポンスヘッダー（任意、キャッシュにも保存されます）
+
+    Returns:
+        Response: X-Response-Mode: document が指定された場合はURLを含むJSON、
+                  それ以外の場合はPDFファイル（添付ファイル）
+
+    Note:
+        cached_result を適用したエンドポイントから呼び出された場合は、処理結果をキャッシュに保存します。
+        ただし、パスワードで保護されたPDFを復号して作った処理結果は、出力を暗号化する場合を除いて保存しません
+        （キャッシュには有効期限がないため、復号した内容が作業用のコピーの有効期限を過ぎて残らないようにする）。
+    """
+    key = g.get('result_cache_key')
+    if g.get('decrypted_upload') and not request.form.get('output_password'):
+        key = None
+    if key is not None:
+        try:
+            cached = store_result(key, output, download_name, headers)
+        except OSError:
+            # キャッシュに保存できなくても処理結果はそのまま返す
+            cached = None
+        if cached is not None:
+            return send_cached_result(cached)
+
+    if wants_document_response():
+        response = document_response(output, download_name)
+    else:
+        response = send_file(output, mimetype='application/pdf')
+        response.headers['Content-Disposition'] = attachment_disposition(download_name)
+    response.headers.update(headers or {})
+    return response
+
+def send_document(path, download_name=None):
+    """
+    保存済みのPDFを Range リクエスト・ETag 対応で送信する関数
+
+    Args:
+        path (str): PDFファイルの絶対パス
+        download_name (str): 添付ファイルとして送信する場合のファイル名
+
+    Returns:
+        Response: PDFファイル（Range リクエストの場合は 206 Partial Content）
+    """
+    response = send_file(
+        path,
+        mimetype='application/pdf',
+        conditional=True,
+        etag=True,
+        max_age=0,
+    )
+    if download_name is not None:
+        response.headers['Content-Disposition'] = attachment_disposition(download_name)
+    # PDF.js は最初のレスポンスの Accept-Ranges を見て Range 読み込みを有効にするため、
+    # 206 以外のレスポンスにも付与する
+    response.headers['Accept-Ranges'] = 'bytes'
+    # プレビューは同じ内容を何度も読み込むため、ETagで再検証させる
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+@documents_bp.route('/documents/uploads/<upload_id>', methods=['GET'])
+def serve_upload(upload_id):
+    """
+    アップロードされたPDFを配信するエンドポイント
+
+    Returns:
+        file: PDFファイル（Range リクエストに対応）
+        json: エラーメッセージ（失敗時）
+
+    HTTP Status Codes:
+        200: 成功
+        206: 部分取得（Range リクエスト）
+        304: 変更なし（If-None-Match）
+        404: ファイルが存在しない（有効期限切れを含む）
+        416: 範囲外の Range 指定
+    """
+    path = find_upload(upload_id)
+    if path is None:
+        return jsonify({'error': 'ファイルが見つかりません。有効期限が切れた可能性があります。'}), 404
+    return send_document(path)
+
+@documents_bp.route('/documents/decrypted/<key>', methods=['GET'])
+def serve_decrypted(key):
+    """
+    パスワードで保護されたPDFの作業用のコピーを配信するエンドポイント
+
+    Returns:
+        file: 復号したPDFファイル（Range リクエストに対応）
+        json: エラーメッセージ（失敗時）
+
+    HTTP Status Codes:
+        200: 成功
+        206: 部分取得（Range リクエスト）
+        304: 変更なし（If-None-Match）
+        404: ファイルが存在しない（有効期限切れを含む）
+        416: 範囲外の Range 指定
+
+    Note:
+        キーは元のファイルの内容と正しいパスワードから計算されるため、
+        ファイルとパスワードを知らない利用者はURLを推測できません。
+    """
+    path = find_decrypted(key)
+    if path is None:
+        return jsonify({'error': 'ファイルが見つかりません。有効期限が切れた可能性があります。'}), 404
+    return send_document(path)
+
+@documents_bp.route('/documents/outputs/<document_id>', methods=['GET'])
+def serve_output(document_id):
+    """
+    処理結果のPDFを配信するエンドポイント
+
+    Query Parameters:
+        download: 1 の場合は添付ファイル（ダウンロード）として送信
+
+    Returns:
+        file: PDFファイル（Range リクエストに対応）
+        json: エラーメッセージ（失敗時）
+
+    HTTP Status Codes:
+        200: 成功
+        206: 部分取得（Range リクエスト）
+        304: 変更なし（If-None-Match）
+        404: 処理結果が存在しない（有効期限切れを含む）
+        416: 範囲外の Range 指定
+    """
+    found = find_output(document_id)
+    if found is None:
+        return jsonify({'error': '処理結果が見つかりません。有効期限が切れた可能性があります。'}), 404
+
+    path, download_name = found
+    if request.args.get('download') == '1':
+        return send_document(path, download_name)
+    return send_document(path)
@@ -0,0 +1,208 @@
+"""
+パスワードで保護されたPDFの復号
+
+アップロードされたPDFが暗号化されている場合、フォームの password で復号し、
+暗号化されていない作業用のコピーに差し替えてからエンドポイントの処理を行います。
+
+PyPDF2 はオブジェクトを読み込むたびに復号するため、AESで暗号化された大きなPDFでは
+処理のたびに復号の負荷がかかります。そこで復号は1つのアップロードにつき1回だけ行い、
+作業用のコピーを一定時間保持して、同じファイルの以降の処理で再利用します。
+
+作業用のコピーは、元のファイルの内容のSHA-256と復号に使用したパスワードから計算した
+キーで保存するため、同じファイルと正しいパスワードを送信した場合にのみ再利用されます。
+復号した内容は作業用のコピーにのみ保持し、アップロードフォルダには保存しません。
+"""
+
+import functools
+import hashlib
+import os
+import re
+import time
+import uuid
+
+from flask import g, jsonify, request
+
+from admission import HEAVY_LANE, LaneBusyError, busy_response, lane_slot
+from pdf_operations import decrypt_pdf, is_encrypted_pdf
+from result_cache import file_digest
+from storage import ensure_upload_folder
+
+# 作業用のコピーのキーとして受け付ける形式（パストラバーサル対策）
+DECRYPTED_KEY_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+def decrypted_folder():
+    """
+    作業用のコピーの保存先を返す関数
+
+    Returns:
+        str: アップロードフォルダ内の作業用コピー保存用フォルダのパス
+    """
+    path = os.path.join(ensure_upload_folder(), '.decrypted')
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    return path
+
+def decrypted_path(digest, password):
+    """
+    作業用のコピーの保存先のパスを返す関数
+
+    Args:
+        digest (str): 元のファイルの内容のSHA-256
+        password (str): 復号に使用したパスワード
+
+    Returns:
+        str: 作業用のコピーのパス
+    """
+    key = hashlib.sha256(f'{digest}\0{password}'.encode('utf-8')).hexdigest()
+    return os.path.join(decrypted_folder(), f'{key}.pdf')
+
+def decrypted_key(stream):
+    """
+    作業用のコピーのキーを返す関数
+
+    Args:
+        stream: open_decrypted が返したファイル、または decrypted_uploads で差し替えられたファイルの stream
+
+    Returns:
+        str: 作業用のコピーのキー（作業用のコピーでない場合はNone）
+    """
+    path = getattr(stream, 'name', None)
+    if not isinstance(path, str):
+        return None
+    if os.path.dirname(os.path.abspath(path)) != os.path.abspath(decrypted_folder()):
+        return None
+    return os.path.splitext(os.path.basename(path))[0]
+
+def find_decrypted(key):
+    """
+    作業用のコピーを探す関数
+
+    Args:
+        key (str): 作業用のコピーのキー
+
+    Returns:
+        str: 作業用のコピーの絶対パス（見つからない場合や有効期限を過ぎている場合はNone）
+
+    Note:
+        プレビューのための配信では有効期限を延長しません。
+    """
+    if not DECRYPTED_KEY_PATTERN.match(key):
+        return None
+    remove_expired_decrypted()
+    path = os.path.abspath(os.path.join(decrypted_folder(), f'{key}.pdf'))
+    try:
+        if time.time() - os.path.getmtime(path) > decrypted_ttl():
+            return None
+    except OSError:
+        return None
+    return path
+
+def decrypted_ttl():
+    """
+    作業用のコピーの有効期限を返す関数
+
+    Returns:
+        int: 有効期限（秒）
+
+    Note:
+        有効期限は環境変数 DECRYPTED_TTL（秒、デフォルト: 3600）で指定します。
+    """
+    return int(os.environ.get('DECRYPTED_TTL', 60 * 60))
+
+def remove_expired_decrypted():
+    """
+    有効期限を過ぎた作業用のコピーを削除する関数
+
+    Note:
+        作業用のコピーを復号のために使用するたびに有効期限が延長されます。
+    """
+    ttl = decrypted_ttl()
+    folder = decrypted_folder()
+    now = time.time()
+    for name in os.listdir(folder):
+        path = os.path.join(folder, name)
+        try:
+            if now - os.path.getmtime(path) > ttl:
+                os.remove(path)
+        except OSError:
+            continue
+
+def open_decrypted(file, passwords):
+    """
+    暗号化されたPDFの作業用のコピーを開く関数
+
+    Args:
+        file: アップロードされた暗号化PDF（ファイルオブジェクト）
+        passwords (list): フォームで入力されたパスワードのリスト
+
+    Returns:
+        file: 作業用のコピー（読み込み用に開いたファイル）
+
+    Raises:
+        ValueError: パスワードが入力されていない、または正しくない場合
+        LaneBusyError: 復号が必要で、加工処理のレーン（HEAVY_LANE）が混み合っている場合
+
+    Note:
+        復号はファイル全体を読み込み直す重い処理のため、軽い処理のレーンのエンドポイント（/upload など）から
+        呼び出された場合も、加工処理のレーンの空きを取得してから行います。
+    """
+    remove_expired_decrypted()
+    digest = file_digest(file)
+
+    # 以前に復号した作業用のコピーがあれば再利用
+    for password in [''] + [password for password in passwords if password]:
+        path = decrypted_path(digest, password)
+        try:
+            decrypted = open(path, 'rb')
+        except OSError:
+            continue
+        os.utime(path)
+        return decrypted
+
+    temp_path = os.path.join(decrypted_folder(), f'{uuid.uuid4().hex}.tmp')
+    try:
+        with lane_slot(HEAVY_LANE):
+            password = decrypt_pdf(file, passwords, temp_path)
+        os.chmod(temp_path, 0o600)
+        path = decrypted_path(digest, password)
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return open(path, 'rb')
+
+def decrypted_uploads(view):
+    """
+    アップロードされた暗号化PDFを作業用のコピーに差し替えるデコレーター
+
+    Args:
+        view (function): アップロードされたPDFを処理するエンドポイント関数
+
+    Returns:
+        function: 暗号化PDFを復号してから元の関数を呼び出す関数
+
+    Note:
+        パスワードはフォームの password で指定します（複数指定した場合は順に試行します）。
+        パスワードが入力されていない、または正しくない場合は 400 を返します。
+        復号のために加工処理のレーンの空きを待てなかった場合は 503 を返します。
+        復号したファイルから作った処理結果は、出力を暗号化する場合を除き、処理結果のキャッシュに保存されません。
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        passwords = request.form.getlist('password')
+        for _, file in request.files.items(multi=True):
+            if not file.filename.lower().endswith('.pdf') or not is_encrypted_pdf(file):
+                continue
+            try:
+                decrypted = open_decrypted(file, passwords)
+            except ValueError as e:
+                return jsonify({'error': f'ファイル "{file.filename}": {str(e)}'}), 400
+            except LaneBusyError:
+                return busy_response()
+            except Exception as e:
+                return jsonify({'error': f'ファイル "{file.filename}" の復号中にエラーが発生しました: {str(e)}'}), 500
+            file.stream.close()
+            file.stream = decrypted
+            # 復号した入力から作った処理結果をキャッシュに残さないための目印（send_pdf で参照）
+            g.decrypted_upload = True
+        return view(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,241 @@
+"""
+メモリ使用量の見積もりと予算管理
+
+PDF処理のメモリ使用量は、ファイルサイズ、ページ数、埋め込まれた画像などによって大きく変わります。
+大きなファイルの処理でワーカープロセスがメモリ不足で強制終了されると、
+同じプロセスで処理中の小さなリクエストも巻き添えになります。
+
+そこで、重い処理を始める前にファイルサイズとページ数（トレーラーの /Root /Pages /Count）から
+メモリ使用量を見積もり、プロセス全体のメモリ予算と照らし合わせます：
+1. 予算に空きがあれば、そのままメモリ上で処理
+2. 空きが足りなければ、処理結果を一時ファイルに書き出す（ディスクを使う）方法で処理
+3. それでも足りなければ空きを待ち、待ち時間を過ぎた場合は 503 と Retry-After を返す
+4. 予算全体を超える大きさのリクエストは 413 とエラーメッセージを返す
+"""
+
+import functools
+import os
+import threading
+
+from flask import g, jsonify, request
+
+from admission import busy_response
+
+# 解析済みオブジェクトが使用するメモリのファイルサイズに対する倍率
+PARSE_FACTOR = 2
+
+# 1ページあたりのオブジェクト（ページ辞書、リソース、コンテンツストリーム）のメモリ
+PAGE_OVERHEAD = 32 * 1024
+
+# 画像を展開した場合の1ピクセルあたりのメモリ（RGBA）
+PIXEL_BYTES = 4
+
+class MemoryBudget:
+    """
+    プロセス全体で共有するメモリ予算
+
+    Note:
+        予算は環境変数 MEMORY_BUDGET_BYTES（デフォルト: 1GB）で指定します。
+        Gunicorn の gthread ワーカーのように、1つのプロセスで複数のリクエストを同時に処理する場合に、
+        処理中のリクエストの見積もりの合計が予算を超えないようにします。
+    """
+
+    def __init__(self):
+        self.reserved = 0
+        self.condition = threading.Condition()
+
+    @property
+    def total(self):
+        """
+        int: 予算のバイト数
+        """
+        return int(os.environ.get('MEMORY_BUDGET_BYTES', 1024 * 1024 * 1024))
+
+    def try_reserve(self, cost):
+        """
+        予算に空きがあれば確保する関数
+
+        Args:
+            cost (int): 確保するバイト数
+
+        Returns:
+            bool: 確保できた場合True
+        """
+        with self.condition:
+            if self.reserved + cost > self.total:
+                return False
+            self.reserved += cost
+            return True
+
+    def reserve(self, cost, timeout):
+        """
+        予算に空きができるまで待って確保する関数
+
+        Args:
+            cost (int): 確保するバイト数
+            timeout (float): 最大待ち時間（秒）
+
+        Returns:
+            bool: 確保できた場合True、待ち時間を過ぎた場合False
+        """
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.reserved + cost <= self.total, timeout):
+                return False
+            self.reserved += cost
+            return True
+
+    def release(self, cost):
+        """
+        確保した予算を解放する関数
+
+        Args:
+            cost (int): 解放するバイト数
+        """
+        with self.condition:
+            self.reserved -= cost
+            self.condition.notify_all()
+
+MEMORY_BUDGET = MemoryBudget()
+
+def pdf_page_count(file):
+    """
+    PDFのページ数をトレーラーから読み取る関数
+
+    Args:
+        file: アップロードされたファイルオブジェクト
+
+    Returns:
+        int: ページ数（読み取れない場合は0）
+
+    Note:
+        ページツリーを展開せずに /Root /Pages /Count を参照するため、大きなPDFでも軽量です。
+        ファイルポインタは関数終了後に先頭に戻されます。
+    """
+    from PyPDF2 import PdfReader
+
+    try:
+        return int(PdfReader(file).trailer['/Root']['/Pages']['/Count'])
+    except Exception:
+        return 0
+    finally:
+        file.seek(0)
+
+def image_pixel_count(file):
+    """
+    画像を展開した場合のピクセル数をヘッダーから読み取る関数
+
+    Args:
+        file: アップロードされたファイルオブジェクト
+
+    Returns:
+        int: ピクセル数（読み取れない場合は0）
+    """
+    from PIL import Image
+
+    try:
+        with Image.open(file) as image:
+            width, height = image.size
+        return width * height
+    except Exception:
+        return 0
+    finally:
+        file.seek(0)
+
+def file_size(file):
+    """
+    アップロードされたファイルのサイズを返す関数
+
+    Args:
+        file: アップロードされたファイルオブジェクト
+
+    Returns:
+        int: バイト数
+    """
+    size = file.seek(0, os.SEEK_END)
+    file.seek(0)
+    return size
+
+def estimate_request_cost(streaming=False):
+    """
+    現在のリクエストのメモリ使用量を見積もる関数
+
+    Args:
+        streaming (bool): Trueの場合、一時ファイルに書き出す方法ではファイルを1つずつ処理する
+                          （ストリーミング結合）として見積もる
+
+    Returns:
+        tuple: (メモリ上で処理する場合のバイト数, 処理結果を一時ファイルに書き出す場合のバイト数)
+
+    Note:
+        files[] のように同じフィールド名で複数のファイルが送信された場合も、すべてのファイルを見積もります。
+        処理結果のPDFは入力の合計サイズと同程度と見積もります。
+        線形化する場合は、書き出し時と線形化時の2つ分を見積もります。
+    """
+    parsed = []
+    output = 0
+    # request.files.values() は各フィールドの最初のファイルしか返さないため、multi=True で列挙する
+    for _, file in request.files.items(multi=True):
+        size = file_size(file)
+        if file.filename.lower().endswith('.pdf'):
+            parsed.append(size * PARSE_FACTOR + pdf_page_count(file) * PAGE_OVERHEAD)
+        else:
+            # 透かし画像はページサイズのPDFに変換する際に展開される
+            parsed.append(size + image_pixel_count(file) * PIXEL_BYTES)
+        output += size
+
+    if request.form.get('linearize', '').lower() in ('1', 'true', 'on'):
+        output *= 2
+    spooled = max(parsed, default=0) if streaming else sum(parsed)
+    return sum(parsed) + output, spooled
+
+def spool_output():
+    """
+    処理結果を一時ファイルに書き出す必要があるか判定する関数
+
+    Returns:
+        bool: メモリ予算の都合で、一時ファイルに書き出す方法で処理する場合True
+    """
+    return g.get('spool_output', False)
+
+def memory_budgeted(view=None, streaming=False):
+    """
+    エンドポイントにメモリ予算の確認を適用するデコレーター
+
+    Args:
+        view (function): 重い処理を行うエンドポイント関数
+        streaming (bool): Trueの場合、一時ファイルに書き出す方法ではファイルを1つずつ処理するエンドポイント
+                          （@memory_budgeted(streaming=True) のように指定）
+
+    Returns:
+        function: メモリ予算を確保してから元の関数を呼び出す関数
+
+    Note:
+        空きを待つ最大時間は環境変数 MEMORY_BUDGET_TIMEOUT（秒、デフォルト: 30）で指定します。
+    """
+    if view is None:
+        return functools.partial(memory_budgeted, streaming=streaming)
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        in_memory, spooled = estimate_request_cost(streaming)
+
+        if spooled > MEMORY_BUDGET.total:
+            limit_mb = MEMORY_BUDGET.total // (1024 * 1024)
+            estimate_mb = spooled // (1024 * 1024)
+            return jsonify({'error': f'ファイルが大きすぎるため処理できません（推定メモリ使用量: {estimate_mb}MB、上限: {limit_mb}MB）。ファイルを分割してから再度お試しください。'}), 413
+
+        if in_memory <= MEMORY_BUDGET.total and MEMORY_BUDGET.try_reserve(in_memory):
+            cost = in_memory
+        else:
+            # メモリ上では処理できないため、処理結果を一時ファイルに書き出す
+            g.spool_output = True
+            timeout = float(os.environ.get('MEMORY_BUDGET_TIMEOUT', 30))
+            if not MEMORY_BUDGET.reserve(spooled, timeout):
+                return busy_response()
+            cost = spooled
+
+        try:
+            return view(*args, **kwargs)
+        finally:
+            MEMORY_BUDGET.release(cost)
+    return wrapper
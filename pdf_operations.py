@@ -0,0 +1,864 @@
+"""
+PDF処理の共通操作
+
+Flask のルート（app.py）とコマンドラインツール（cli.py）の両方から使用される
+PDF処理関数をまとめたモジュールです。
+
+各操作関数は PdfReader を受け取り、結果の PdfWriter を返します。
+入力内容が不正な場合は、利用者向けのメッセージを持つ ValueError を送出します。
+
+PyPDF2 / ReportLab / PIL は読み込みに時間がかかるため、各関数の中で import します。
+"""
+
+import importlib.util
+import io
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+from datetime import datetime
+
+# 透かしとして使用できるファイルの拡張子
+WATERMARK_EXTENSIONS = ['pdf', 'png', 'jpg', 'jpeg', 'gif', 'bmp']
+
+def is_valid_pdf(file):
+    """
+    PDFファイルの妥当性を検証する関数
+
+    Args:
+        file: アップロードされたファイルオブジェクト
+
+    Returns:
+        bool: PDFファイルが有効な場合True、そうでなければFalse
+
+    Note:
+        ファイルポインタは関数終了後に先頭に戻されます
+    """
+    from PyPDF2 import PdfReader
+
+    try:
+        reader = PdfReader(file)
+        # ファイルポインタを先頭に戻す
+        file.seek(0)
+        return True
+    except Exception:
+        return False
+
+def is_valid_image(file):
+    """
+    画像ファイルの妥当性を検証する関数
+
+    Args:
+        file: アップロードされたファイルオブジェクト
+
+    Returns:
+        bool: 画像ファイルが有効な場合True、そうでなければFalse
+
+    Note:
+        ファイルポインタは関数終了後に先頭に戻されます
+    """
+    from PIL import Image
+
+    try:
+        img = Image.open(file)
+        img.verify()
+        # ファイルポインタを先頭に戻す
+        file.seek(0)
+        return True
+    except Exception:
+        return False
+
+def is_encrypted_pdf(file):
+    """
+    PDFファイルがパスワードで保護（暗号化）されているか判定する関数
+
+    Args:
+        file: アップロードされたファイルオブジェクト
+
+    Returns:
+        bool: 暗号化されている場合True（PDFとして読み込めない場合はFalse）
+
+    Note:
+        ファイルポインタは関数終了後に先頭に戻されます
+    """
+    from PyPDF2 import PdfReader
+
+    try:
+        return PdfReader(file).is_encrypted
+    except Exception:
+        return False
+    finally:
+        file.seek(0)
+
+def decrypt_pdf(source, passwords, target_path):
+    """
+    暗号化されたPDFを復号し、暗号化されていない作業用のコピーを保存する関数
+
+    Args:
+        source: 暗号化されたPDF（ファイルオブジェクト）
+        passwords (list): 試行するパスワードのリスト（空のパスワードは常に最初に試行します）
+        target_path (str): 復号したPDFの保存先
+
+    Returns:
+        str: 復号に使用したパスワード
+
+    Raises:
+        ValueError: パスワードが入力されていない、またはいずれのパスワードも正しくない場合
+
+    Note:
+        PyPDF2 はオブジェクトを読み込むたびに Python で復号するため、AESで暗号化された
+        大きなPDFでは処理が遅くなります。pikepdf がインストールされている場合は pikepdf
+        （qpdf のC++実装）で一括して復号し、ない場合は PyPDF2 で全オブジェクトを1回だけ復号して保存します。
+    """
+    candidates = [''] + [password for password in passwords if password]
+
+    try:
+        import pikepdf
+    except ImportError:
+        pikepdf = None
+
+    try:
+        if pikepdf is not None:
+            for password in candidates:
+                source.seek(0)
+                try:
+                    with pikepdf.open(source, password=password) as pdf:
+                        pdf.save(target_path)
+                    return password
+                except pikepdf.PasswordError:
+                    continue
+        else:
+            from PyPDF2 import PdfReader, PdfWriter
+
+            source.seek(0)
+            reader = PdfReader(source)
+            for password in candidates:
+                if reader.decrypt(password):
+                    writer = PdfWriter()
+                    writer.clone_reader_document_root(reader)
+                    writer.write(target_path)
+                    return password
+    finally:
+        source.seek(0)
+
+    if len(candidates) == 1:
+        raise ValueError('パスワードで保護されたPDFです。パスワードを入力してください')
+    raise ValueError('パスワードが正しくありません')
+
+def create_watermark_pdf_from_image(image_file, page_width, page_height, opacity=0.3):
+    """
+    画像ファイルから透かし用PDFを作成する関数
+
+    Args:
+        image_file: 透かし用の画像ファイル
+        page_width (float): ページの幅
+        page_height (float): ページの高さ
+        opacity (float): 透明度（0.0-1.0、デフォルト: 0.3）
+
+    Returns:
+        io.BytesIO: 生成された透かしPDFのバイナリデータ
+
+    Raises:
+        Exception: 透かしPDFの作成に失敗した場合
+
+    Note:
+        画像は指定されたページサイズに合わせてスケーリングされ、
+        中央に配置されます。
+    """
+    from PIL import Image
+    from reportlab.lib.utils import ImageReader
+    from reportlab.pdfgen import canvas
+
+    try:
+        # 画像を開く
+        img = Image.open(image_file)
+
+        # 透明度を設定（RGBA形式に変換）
+        if img.mode != 'RGBA':
+            img = img.convert('RGBA')
+
+        # 透明度を調整
+        alpha = img.split()[-1]
+        alpha = alpha.point(lambda p: int(p * opacity))
+        img.putalpha(alpha)
+
+        # ImageReaderオブジェクトを作成
+        img_buffer = io.BytesIO()
+        img.save(img_buffer, format='PNG')
+        img_buffer.seek(0)
+        img_reader = ImageReader(img_buffer)
+
+        # PDFを作成
+        pdf_buffer = io.BytesIO()
+        c = canvas.Canvas(pdf_buffer, pagesize=(page_width, page_height))
+
+        # 画像のサイズを計算（ページサイズに合わせてスケーリング）
+        img_width, img_height = img.size
+        scale_x = page_width / img_width
+        scale_y = page_height / img_height
+        scale = min(scale_x, scale_y) * 0.8  # 少し小さくして余白を作る
+
+        new_width = img_width * scale
+        new_height = img_height * scale
+
+        # 中央に配置
+        x = (page_width - new_width) / 2
+        y = (page_height - new_height) / 2
+
+        # 画像を描画（ImageReaderオブジェクトを使用）
+        c.drawImage(img_reader, x, y, width=new_width, height=new_height, mask='auto')
+        c.save()
+
+        pdf_buffer.seek(0)
+        return pdf_buffer
+
+    except Exception as e:
+        raise Exception(f"画像から透かしPDFの作成に失敗しました: {str(e)}")
+
+def parse_page_ranges(spec, page_count, strict=False):
+    """
+    ページ範囲の文字列を解析する関数
+
+    Args:
+        spec (str): ページ範囲（例: "1-3,5,7-9"、1ベース）
+        page_count (int): 文書の総ページ数
+        strict (bool): Trueの場合、数値として解釈できない指定でValueErrorを送出
+
+    Returns:
+        set: 0ベースのページ番号の集合
+
+    Raises:
+        ValueError: strict=True で数値として解釈できない指定が含まれる場合
+
+    Note:
+        文書の範囲外のページや、開始が終了より大きい範囲は無視されます。
+    """
+    pages = set()
+    for part in spec.split(','):
+        part = part.strip()
+        if not part:  # 空の部分をスキップ
+            continue
+        try:
+            if '-' in part:
+                start, end = map(int, part.split('-'))
+                if start < 1 or end > page_count or start > end:
+                    continue
+                pages.update(range(start-1, end))
+            else:
+                page_num = int(part) - 1
+                if 0 <= page_num < page_count:
+                    pages.add(page_num)
+        except ValueError:
+            if strict:
+                raise
+            continue
+    return pages
+
+def parse_page_sequence(spec, page_count):
+    """
+    ページ範囲の文字列を、指定された順序のまま解析する関数
+
+    Args:
+        spec (str): ページ範囲（例: "3,1-2,5-"、1ベース。"5-" は5ページ目から最後まで、空の場合は全ページ）
+        page_count (int): 文書の総ページ数
+
+    Returns:
+        list: 0ベースのページ番号のリスト（指定された順序、重複も保持）
+
+    Raises:
+        ValueError: 数値として解釈できない指定や、文書の範囲外のページが含まれる場合
+    """
+    if not spec.strip():
+        return list(range(page_count))
+
+    pages = []
+    for part in spec.split(','):
+        part = part.strip()
+        if not part:  # 空の部分をスキップ
+            continue
+        try:
+            if '-' in part:
+                start, end = part.split('-', 1)
+                start = int(start)
+                end = int(end) if end.strip() else page_count
+            else:
+                start = end = int(part)
+        except ValueError:
+            raise ValueError(f'ページ範囲 "{part}" を解釈できません')
+        if start < 1 or end > page_count or start > end:
+            raise ValueError(f'ページ範囲 "{part}" は1から{page_count}の範囲で指定してください')
+        pages.extend(range(start - 1, end))
+    return pages
+
+class LinearizationUnavailableError(RuntimeError):
+    """
+    線形化（高速Web表示）・暗号化に必要なツールが見つからない場合の例外
+    """
+
+def pdf_rewrite_available():
+    """
+    PDFの線形化・AES暗号化に使用するツールが利用できるか判定する関数
+
+    Returns:
+        bool: pikepdf または qpdf コマンドが利用できる場合True
+
+    Note:
+        メインページの表示のたびに呼び出されるため、pikepdf（PIL も読み込まれます）は import せず、
+        インストールされているかだけを確認します。実際の読み込みは rewrite_pdf で行います。
+    """
+    if importlib.util.find_spec('pikepdf') is not None:
+        return True
+    return shutil.which('qpdf') is not None
+
+def rewrite_pdf(source, linearize=False, password=None, spool=False):
+    """
+    PDFを線形化（高速Web表示用に最適化）・暗号化して書き直す関数
+
+    Args:
+        source: 書き直すPDF（先頭にシークされたファイルオブジェクト）
+        linearize (bool): Trueの場合、線形化する
+        password (str): 指定した場合、このパスワードで暗号化する（AES-256）
+        spool (bool): Trueの場合、メモリではなく一時ファイルに書き出す
+
+    Returns:
+        file: 先頭にシークされたPDF（io.BytesIO または一時ファイル）
+
+    Raises:
+        LinearizationUnavailableError: pikepdf も qpdf コマンドも利用できない場合
+
+    Note:
+        PyPDF2 は線形化に対応していないため、pikepdf（インストールされている場合）
+        または qpdf コマンドを使用します。線形化されたPDFは、最初のページに必要な
+        オブジェクトがファイルの先頭に配置され、ヒントテーブルと線形化辞書を持つため、
+        ビューアーはファイル全体を読み込む前に最初のページを表示できます。
+    """
+    try:
+        import pikepdf
+    except ImportError:
+        pikepdf = None
+
+    output = tempfile.TemporaryFile() if spool else io.BytesIO()
+
+    if pikepdf is not None:
+        encryption = pikepdf.Encryption(owner=password, user=password, R=6) if password else False
+        with pikepdf.open(source) as pdf:
+            pdf.save(output, linearize=linearize, encryption=encryption)
+        output.seek(0)
+        return output
+
+    qpdf = shutil.which('qpdf')
+    if qpdf is None:
+        if linearize:
+            raise LinearizationUnavailableError(
+                '高速Web表示（線形化）には pikepdf または qpdf コマンドが必要です'
+            )
+        raise LinearizationUnavailableError('このPDFの暗号化には pikepdf または qpdf コマンドが必要です')
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        source_path = os.path.join(temp_dir, 'source.pdf')
+        target_path = os.path.join(temp_dir, 'rewritten.pdf')
+        with open(source_path, 'wb') as f:
+            shutil.copyfileobj(source, f)
+
+        arguments = []
+        if linearize:
+            arguments.append('--linearize')
+        if password:
+            arguments += ['--encrypt', password, password, '256', '--']
+        arguments += [source_path, target_path]
+
+        # パスワードがプロセス一覧に表示されないよう、引数はファイルで渡す
+        arguments_path = os.path.join(temp_dir, 'arguments')
+        with open(arguments_path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(arguments) + '\n')
+
+        # 終了コード3は警告ありで成功（修復可能な問題があった場合）
+        result = subprocess.run([qpdf, f'@{arguments_path}'], capture_output=True, text=True)
+        if result.returncode not in (0, 3):
+            raise RuntimeError(f'PDFの書き直しに失敗しました: {result.stderr.strip()}')
+        with open(target_path, 'rb') as f:
+            shutil.copyfileobj(f, output)
+    output.seek(0)
+    return output
+
+def write_pdf(writer, linearize=False, spool=False, password=None):
+    """
+    PdfWriter（または PdfMerger）の内容を書き出す関数
+
+    Args:
+        writer: 書き出す PdfWriter または PdfMerger
+        linearize (bool): Trueの場合、線形化（高速Web表示）したPDFを書き出す
+        spool (bool): Trueの場合、メモリではなく一時ファイルに書き出す（大きなPDF向け）
+        password (str): 指定した場合、このパスワードで暗号化したPDFを書き出す
+
+    Returns:
+        file: 先頭にシークされたPDF（io.BytesIO または一時ファイル）
+
+    Note:
+        暗号化には pikepdf または qpdf コマンド（AES-256）を使用します。
+        どちらも利用できない場合は PyPDF2 で暗号化します（RC4 128bit）。
+    """
+    if password and not linearize and not pdf_rewrite_available():
+        # PdfMerger の場合は内部の PdfWriter を暗号化する
+        getattr(writer, 'output', writer).encrypt(password)
+        password = None
+
+    output = tempfile.TemporaryFile() if spool else io.BytesIO()
+    writer.write(output)
+    output.seek(0)
+    if linearize or password:
+        return rewrite_pdf(output, linearize=linearize, password=password, spool=spool)
+    return output
+
+def merge_documents(files):
+    """
+    複数のPDFを順番に結合する関数
+
+    Args:
+        files (list): 結合するPDF（ファイルオブジェクトまたはパス）のリスト
+
+    Returns:
+        PdfMerger: 結合結果
+    """
+    from PyPDF2 import PdfMerger
+
+    merger = PdfMerger()
+    for file in files:
+        merger.append(file)
+    return merger
+
+def split_document(reader, page_indices):
+    """
+    指定したページのみを取り出す関数
+
+    Args:
+        reader (PdfReader): 元のPDF
+        page_indices (set): 取り出すページ番号（0ベース）
+
+    Returns:
+        PdfWriter: 指定ページのみを含むPDF
+
+    Raises:
+        ValueError: 有効なページが指定されていない場合
+    """
+    from PyPDF2 import PdfWriter
+
+    if not page_indices:
+        raise ValueError('有効なページが指定されていません')
+
+    writer = PdfWriter()
+    # 選択されたページを順番に追加
+    for page_num in sorted(page_indices):
+        writer.add_page(reader.pages[page_num])
+    return writer
+
+def rotate_document(reader, rotation, page_indices=None):
+    """
+    ページを回転する関数
+
+    Args:
+        reader (PdfReader): 元のPDF
+        rotation (int): 回転角度（90の倍数）
+        page_indices (set): 回転するページ番号（0ベース、Noneの場合は全ページ）
+
+    Returns:
+        PdfWriter: 回転後のPDF
+
+    Raises:
+        ValueError: ページ指定が空の場合
+    """
+    from PyPDF2 import PdfWriter
+
+    if page_indices is not None and not page_indices:
+        raise ValueError('有効なページ範囲が指定されていません')
+
+    writer = PdfWriter()
+    for i, page in enumerate(reader.pages):
+        if page_indices is None or i in page_indices:
+            page = page.rotate(rotation)
+        writer.add_page(page)
+    return writer
+
+def remove_pages(reader, page_indices):
+    """
+    指定したページを削除する関数
+
+    Args:
+        reader (PdfReader): 元のPDF
+        page_indices (set): 削除するページ番号（0ベース）
+
+    Returns:
+        PdfWriter: 指定ページを除いたPDF
+
+    Raises:
+        ValueError: 有効なページが指定されていない場合、または全ページが削除対象の場合
+    """
+    from PyPDF2 import PdfWriter
+
+    if not page_indices:
+        raise ValueError('有効なページ番号が指定されていません')
+
+    writer = PdfWriter()
+    # 指定されたページ以外を追加
+    for i in range(len(reader.pages)):
+        if i not in page_indices:
+            writer.add_page(reader.pages[i])
+
+    if not writer.pages:
+        raise ValueError('すべてのページが削除対象として指定されています')
+    return writer
+
+def insert_document(main_reader, insert_reader, position):
+    """
+    PDFの指定位置に別のPDFを挿入する関数
+
+    Args:
+        main_reader (PdfReader): メインのPDF
+        insert_reader (PdfReader): 挿入するPDF
+        position (int): 挿入位置（1ベース、1 = 最初のページの前）
+
+    Returns:
+        PdfWriter: 挿入後のPDF
+
+    Raises:
+        ValueError: 挿入位置が範囲外の場合
+    """
+    from PyPDF2 import PdfWriter
+
+    main_pages_count = len(main_reader.pages)
+
+    # 挿入位置の妥当性チェック（1からメインページ数+1まで）
+    if position < 1 or position > main_pages_count + 1:
+        raise ValueError(f'挿入位置は1から{main_pages_count + 1}の範囲で指定してください')
+
+    writer = PdfWriter()
+    # 挿入位置より前のページを追加
+    for i in range(position - 1):
+        writer.add_page(main_reader.pages[i])
+
+    # 挿入するPDFのすべてのページを追加
+    for page in insert_reader.pages:
+        writer.add_page(page)
+
+    # 挿入位置より後のページを追加
+    for i in range(position - 1, main_pages_count):
+        writer.add_page(main_reader.pages[i])
+    return writer
+
+def parse_assembly_plan(plan, page_counts):
+    """
+    ページ組み立ての指示を検証・解析する関数
+
+    Args:
+        plan (list): 組み立ての指示のリスト。各要素は次のキーを持つ辞書
+                     doc: 元のPDFの番号（1ベース）
+                     pages: ページ範囲（例: "1-2"、省略時は全ページ）
+                     rotation: 回転角度（90の倍数、省略可）
+        page_counts (list): 元のPDFごとの総ページ数
+
+    Returns:
+        list: (元のPDFの番号（0ベース）, 0ベースのページ番号のリスト, 回転角度) のリスト
+
+    Raises:
+        ValueError: 指示の形式、PDFの番号、ページ範囲、回転角度のいずれかが正しくない場合
+    """
+    if not isinstance(plan, list) or not plan:
+        raise ValueError('組み立ての指示が指定されていません')
+
+    steps = []
+    for number, entry in enumerate(plan, start=1):
+        if not isinstance(entry, dict):
+            raise ValueError(f'{number}番目の指示の形式が正しくありません')
+        try:
+            doc = int(entry.get('doc', 0))
+            rotation = int(entry.get('rotation') or 0)
+        except (TypeError, ValueError):
+            raise ValueError(f'{number}番目の指示の doc と rotation は数値で指定してください')
+        if doc < 1 or doc > len(page_counts):
+            raise ValueError(f'{number}番目の指示の doc は1から{len(page_counts)}の範囲で指定してください')
+        if rotation % 90 != 0:
+            raise ValueError(f'{number}番目の指示の rotation は90の倍数で指定してください')
+        try:
+            pages = parse_page_sequence(str(entry.get('pages') or ''), page_counts[doc - 1])
+        except ValueError as e:
+            raise ValueError(f'{number}番目の指示: {e}')
+        steps.append((doc - 1, pages, rotation))
+    return steps
+
+def assemble_document(readers, steps):
+    """
+    複数のPDFから指定したページを指定した順序で取り出し、1つのPDFを組み立てる関数
+
+    Args:
+        readers (list): 元のPDF（PdfReader）のリスト
+        steps (list): parse_assembly_plan が返す (元のPDFの番号, ページ番号のリスト, 回転角度) のリスト
+
+    Returns:
+        PdfWriter: 組み立てたPDF
+
+    Note:
+        各ページは元のページ辞書の浅いコピーとして追加するため、同じページを複数回使っても
+        それぞれ別の角度で回転でき、元のPDFも変更されません。
+        フォントや画像などのリソースは元のPDFのオブジェクトを参照したままなので、
+        同じPDFから取り出したページ間で共有され、出力には1回だけ書き込まれます。
+    """
+    from PyPDF2 import PageObject, PdfWriter
+
+    writer = PdfWriter()
+    for doc_index, page_indices, rotation in steps:
+        reader = readers[doc_index]
+        for page_num in page_indices:
+            page = PageObject(reader)
+            page.update(reader.pages[page_num])
+            if rotation:
+                page.rotate(rotation)
+            writer.add_page(page)
+    return writer
+
+def watermark_document(reader, watermark, watermark_ext):
+    """
+    各ページに透かしを追加する関数
+
+    Args:
+        reader (PdfReader): 透かしを追加するPDF
+        watermark: 透かし用ファイル（PDFまたは画像のファイルオブジェクト）
+        watermark_ext (str): 透かしファイルの拡張子（小文字、ドットなし）
+
+    Returns:
+        PdfWriter: 透かし追加後のPDF
+
+    Note:
+        画像ファイルは自動的に透明度0.3で透かしPDFに変換されます。
+        各ページのサイズに合わせて透かしがスケーリングされます。
+    """
+    from PyPDF2 import PdfReader, PdfWriter
+
+    writer = PdfWriter()
+
+    # 透かしファイルの種類によって処理を分岐
+    if watermark_ext == 'pdf':
+        # PDFファイルの場合（従来の処理）
+        watermark_page = PdfReader(watermark).pages[0]
+
+        for page in reader.pages:
+            page.merge_page(watermark_page)
+            writer.add_page(page)
+        return writer
+
+    # 画像ファイルの場合
+    # 最初のページのサイズを取得して透かしPDFを作成
+    first_page = reader.pages[0]
+    page_box = first_page.mediabox
+    page_width = float(page_box.width)
+    page_height = float(page_box.height)
+
+    # 画像から透かしPDFを作成
+    watermark_pdf_buffer = create_watermark_pdf_from_image(watermark, page_width, page_height)
+    watermark_page = PdfReader(watermark_pdf_buffer).pages[0]
+
+    for page in reader.pages:
+        # 各ページのサイズに合わせて透かしを調整
+        current_page_box = page.mediabox
+        current_width = float(current_page_box.width)
+        current_height = float(current_page_box.height)
+
+        # ページサイズが異なる場合は新しい透かしを作成
+        if abs(current_width - page_width) > 1 or abs(current_height - page_height) > 1:
+            watermark.seek(0)  # ファイルポインタをリセット
+            watermark_pdf_buffer = create_watermark_pdf_from_image(watermark, current_width, current_height)
+            watermark_page = PdfReader(watermark_pdf_buffer).pages[0]
+            page_width, page_height = current_width, current_height
+
+        page.merge_page(watermark_page)
+        writer.add_page(page)
+    return writer
+
+def build_bookkeeping_title(date, partner, amount, separator):
+    """
+    電子帳簿保存法に対応したタイトル（ファイル名の元）を作成する関数
+
+    Args:
+        date (str): 日付（例: 20250713）
+        partner (str): 取引先（例: ㈱ひまわり）
+        amount (str): 金額（例: 10000）
+        separator (str): 結合文字（例: -）
+
+    Returns:
+        str: タイトル（例: 20250713-㈱ひまわり-10000）
+
+    Raises:
+        ValueError: 必須項目が入力されていない場合
+    """
+    # 必須フィールドのチェック
+    if not date:
+        raise ValueError('日付を入力してください')
+    if not partner:
+        raise ValueError('取引先を入力してください')
+    if not amount:
+        raise ValueError('金額を入力してください')
+    if not separator:
+        raise ValueError('結合文字を入力してください')
+
+    return f"{date}{separator}{partner}{separator}{amount}"
+
+def set_document_title(reader, title):
+    """
+    既存のメタデータを保持したままタイトルを更新する関数
+
+    Args:
+        reader (PdfReader): 元のPDF
+        title (str): 新しいタイトル
+
+    Returns:
+        PdfWriter: タイトルと更新日が設定されたPDF
+    """
+    from PyPDF2 import PdfWriter
+
+    writer = PdfWriter()
+
+    # 全ページをコピー
+    for page in reader.pages:
+        writer.add_page(page)
+
+    # 既存のメタデータを保持しつつ、タイトルのみを更新
+    existing_metadata = reader.metadata or {}
+    metadata = {}
+
+    # 既存のメタデータを保持
+    for key, value in existing_metadata.items():
+        if key != '/Title':  # タイトル以外は既存の値を保持
+            metadata[key] = value
+
+    # タイトルを更新
+    metadata['/Title'] = title
+
+    # 現在の日時を更新日として設定
+    metadata['/ModDate'] = datetime.now().strftime("D:%Y%m%d%H%M%S")
+
+    writer.add_metadata(metadata)
+    return writer
+
+def generate_bookkeeping_filename(title, original_filename):
+    """
+    タイトルからダウンロード用のファイル名を生成する関数
+
+    Args:
+        title (str): 電帳法対応のタイトル
+        original_filename (str): 元のファイル名（タイトルが使えない場合に使用）
+
+    Returns:
+        str: 拡張子付きの安全なファイル名
+    """
+    # 安全でない文字を削除または置換
+    safe_title = re.sub(r'[<>:"/\\|?*]', '', title)
+    safe_title = safe_title.strip()
+
+    # 空の場合は元のファイル名を使用
+    if not safe_title:
+        safe_title = os.path.splitext(original_filename)[0]
+
+    # 長すぎる場合は短縮
+    if len(safe_title) > 200:
+        safe_title = safe_title[:200]
+
+    return f"{safe_title}.pdf"
+
+def extract_metadata(reader):
+    """
+    PDFのメタデータを辞書形式で取得する関数
+
+    Args:
+        reader (PdfReader): 対象のPDF
+
+    Returns:
+        dict: タイトル、作成者などのメタデータとページ数
+    """
+    metadata = reader.metadata
+
+    # メタデータを辞書形式で整理
+    return {
+        'title': metadata.get('/Title', '') if metadata else '',
+        'author': metadata.get('/Author', '') if metadata else '',
+        'subject': metadata.get('/Subject', '') if metadata else '',
+        'keywords': metadata.get('/Keywords', '') if metadata else '',
+        'creator': metadata.get('/Creator', '') if metadata else '',
+        'producer': metadata.get('/Producer', '') if metadata else '',
+        'creation_date': str(metadata.get('/CreationDate', '')) if metadata else '',
+        'modification_date': str(metadata.get('/ModDate', '')) if metadata else '',
+        'pages': len(reader.pages),
+    }
+
+def summarize_upload(filepath, filename):
+    """
+    保存済みのアップロードファイルの基本情報を取得する関数
+
+    Args:
+        filepath (str): 保存先のパス
+        filename (str): アップロード時のファイル名
+
+    Returns:
+        dict: ページ数、ファイル名、ファイルサイズ
+    """
+    from PyPDF2 import PdfReader
+
+    reader = PdfReader(filepath)
+    return {
+        'ページ数': len(reader.pages),
+        'ファイル名': filename,
+        'ファイルサイズ': os.path.getsize(filepath)
+    }
+
+def inspect_document(filepath, passwords=()):
+    """
+    保存済みのPDFを解析し、一括確認用の情報を取得する関数
+
+    Args:
+        filepath (str): 保存先のパス
+        passwords (list): 暗号化されている場合に試行するパスワードのリスト（空のパスワードは常に最初に試行します）
+
+    Returns:
+        dict: status（ok / encrypted / invalid）、暗号化の有無、ページ数、
+              各ページのサイズ（表示時の向きの [幅, 高さ]、ポイント単位）、メタデータ、エラーメッセージ
+
+    Note:
+        読み込めないPDFや復号できないPDFでも例外は送出せず、status とエラーメッセージで返します。
+        プロセスプールのワーカーで実行できるよう、ファイルオブジェクトではなくパスを受け取ります。
+    """
+    from PyPDF2 import PdfReader
+
+    info = {
+        'status': 'invalid',
+        'encrypted': False,
+        'pages': None,
+        'page_sizes': [],
+        'metadata': {},
+        'error': None,
+    }
+    try:
+        reader = PdfReader(filepath)
+        info['encrypted'] = reader.is_encrypted
+        if reader.is_encrypted:
+            candidates = [''] + [password for password in passwords if password]
+            if not any(reader.decrypt(password) for password in candidates):
+                info['status'] = 'encrypted'
+                if len(candidates) == 1:
+                    info['error'] = 'パスワードで保護されたPDFです。パスワードを入力してください'
+                else:
+                    info['error'] = 'パスワードが正しくありません'
+                return info
+
+        metadata = extract_metadata(reader)
+        info['pages'] = metadata.pop('pages')
+        info['metadata'] = {key: str(value) for key, value in metadata.items()}
+        for page in reader.pages:
+            width = round(float(page.mediabox.width), 2)
+            height = round(float(page.mediabox.height), 2)
+            if page.rotation % 180:
+                width, height = height, width
+            info['page_sizes'].append([width, height])
+        info['status'] = 'ok'
+    except Exception as e:
+        info['status'] = 'invalid'
+        info['error'] = f'PDFファイルの読み込みに失敗しました。ファイルが破損しているか、正しいPDF形式ではありません。（{str(e)}）'
+    return info
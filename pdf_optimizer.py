@@ -0,0 +1,422 @@
+"""
+PDFのサイズ最適化
+
+スキャンした請求書などは、スキャナーの解像度のまま画像が埋め込まれているため、
+表示や印刷に必要な大きさの数倍になっていることがあります。最適化では次を行います：
+- 目標の解像度（DPI）を超える画像を縮小し、JPEGなどで再圧縮（画像ごとにプロセスプールで並列処理）
+- ページのコンテンツで使用されていない画像・フォームをページのリソースから削除
+- どこからも参照されていないオブジェクト（過去の編集履歴など）を出力しない
+- 圧縮されていないコンテンツストリームを圧縮し、画像・コンテンツストリームの ASCII 形式の符号化を取り除く
+
+画像の解像度は、画像の長辺・短辺のピクセル数をページの長辺・短辺の長さで割って見積もります。
+実際の表示サイズはページより小さいことが多いため、見積もりは実際の解像度以下になり、
+必要以上に縮小することはありません。
+
+Note:
+    再圧縮の対象は、8ビットのグレースケール・RGB画像（DCTDecode、FlateDecode（予測子なし）、圧縮なし。
+    ASCII85Decode・ASCIIHexDecode との組み合わせを含む）です。
+    マスク画像、カラーキーマスク（/Mask）、/Decode を持つ画像、CMYK・インデックスカラーなどの画像は変更しません。
+    再圧縮しても小さくならない画像は元のまま残します。
+"""
+
+import io
+import multiprocessing
+import os
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+# 既定の目標解像度（DPI）。画面表示と一般的な印刷に十分な解像度
+DEFAULT_TARGET_DPI = 150
+
+# 再圧縮時のJPEG品質（1-95）
+DEFAULT_JPEG_QUALITY = 75
+
+# 色空間の名前 → 色成分の数
+COLOR_COMPONENTS = {'/DeviceGray': 1, '/DeviceRGB': 3}
+
+# ASCII 形式の符号化（展開してバイナリのまま保存する）
+ASCII_FILTERS = ('/ASCII85Decode', '/ASCIIHexDecode')
+
+# 再圧縮の際に展開できるフィルター（/DCTDecode は最後のフィルターの場合のみ）
+DECODABLE_FILTERS = ('/ASCII85Decode', '/ASCIIHexDecode', '/FlateDecode', '/DCTDecode')
+
+# コンテンツストリームで XObject を描画する演算子（/名前 Do）
+XOBJECT_DO_PATTERN = re.compile(rb'/([^\s/\[\]()<>{}%]+)\s*Do\b')
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def optimization_pool():
+    """
+    画像の再圧縮に使用するプロセスプールを返す関数
+
+    Returns:
+        ProcessPoolExecutor: プロセスプール（最初に使用した時点で作成されます）
+
+    Note:
+        プロセス数は環境変数 OPTIMIZE_WORKERS（デフォルト: CPUコア数 ÷ HEAVY_LANE の同時実行数）で指定します。
+        プールは Gunicorn のワーカーごとに作成されますが、同時に最適化を行うのはレーンの同時実行数までのため、
+        再圧縮に使うプロセスの合計はCPUコア数程度に収まります。
+    """
+    # コマンドラインツールからも読み込まれるため、Flask に依存する admission はここで読み込む
+    from admission import HEAVY_LANE
+
+    global _pool
+
+    with _pool_lock:
+        if _pool is None:
+            default = multiprocessing.cpu_count() // HEAVY_LANE.concurrency()
+            workers = int(os.environ.get('OPTIMIZE_WORKERS', default))
+            _pool = ProcessPoolExecutor(max_workers=max(1, workers))
+        return _pool
+
+def reset_optimization_pool(pool):
+    """
+    異常終了したワーカーを含むプロセスプールを破棄する関数
+
+    Args:
+        pool (ProcessPoolExecutor): 破棄するプロセスプール（次回の使用時に新しく作成されます）
+    """
+    global _pool
+
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def color_components(color_space):
+    """
+    画像の色空間の色成分の数を返す関数
+
+    Args:
+        color_space: 画像の /ColorSpace
+
+    Returns:
+        int: 色成分の数（1 または 3）。再圧縮できない色空間の場合はNone
+    """
+    from PyPDF2.generic import ArrayObject
+
+    color_space = color_space.get_object() if color_space is not None else None
+    if isinstance(color_space, ArrayObject) and len(color_space) == 2 and color_space[0] == '/ICCBased':
+        components = color_space[1].get_object().get('/N')
+        return components if components in (1, 3) else None
+    return COLOR_COMPONENTS.get(color_space)
+
+def image_job(image, dpi, target_dpi, quality):
+    """
+    画像の再圧縮に必要な情報をワーカープロセスに渡せる形で取り出す関数
+
+    Args:
+        image (StreamObject): 画像の XObject
+        dpi (float): 見積もった解像度
+        target_dpi (int): 目標の解像度
+        quality (int): JPEG品質
+
+    Returns:
+        dict: 再圧縮のパラメータ（対象外の画像の場合はNone）
+    """
+    if image.get('/ImageMask') or '/Mask' in image or '/Decode' in image:
+        return None
+    if image.get('/BitsPerComponent') != 8:
+        return None
+
+    components = color_components(image.get('/ColorSpace'))
+    if components is None:
+        return None
+
+    filters = image.get('/Filter')
+    filters = filters.get_object() if filters is not None else []
+    filters = list(filters) if isinstance(filters, list) else [filters]
+    parms = image.get('/DecodeParms')
+    parms = parms.get_object() if parms is not None else []
+    parms = list(parms) if isinstance(parms, list) else [parms] * len(filters)
+
+    # ASCII85 + DCT（ReportLab の出力）のような組み合わせは、最後のフィルター以外は可逆のものだけ対象にする
+    if any(name not in DECODABLE_FILTERS for name in filters) or '/DCTDecode' in filters[:-1]:
+        return None
+    for name, parm in zip(filters, parms):
+        parm = parm.get_object() if parm is not None else None
+        if name == '/FlateDecode' and parm and parm.get('/Predictor', 1) != 1:
+            return None
+
+    scale = target_dpi / dpi
+    width, height = int(image['/Width']), int(image['/Height'])
+    return {
+        'data': image._data,
+        'filters': [str(name) for name in filters],
+        'width': width,
+        'height': height,
+        'components': components,
+        'target_width': max(1, round(width * scale)),
+        'target_height': max(1, round(height * scale)),
+        'quality': quality,
+    }
+
+def decode_filter(name, data):
+    """
+    可逆のフィルターを1つ展開する関数
+
+    Args:
+        name (str): フィルター名（DECODABLE_FILTERS のうち /DCTDecode 以外）
+        data (bytes): 展開するデータ
+
+    Returns:
+        bytes: 展開したデータ
+    """
+    import zlib
+
+    from PyPDF2.filters import ASCII85Decode, ASCIIHexDecode
+
+    if name == '/FlateDecode':
+        return zlib.decompress(data)
+    if name == '/ASCII85Decode':
+        return ASCII85Decode.decode(data)
+    return ASCIIHexDecode.decode(data)
+
+def recompress_image(job):
+    """
+    画像を縮小して再圧縮する関数（ワーカープロセスで実行されます）
+
+    Args:
+        job (dict): image_job で作成した再圧縮のパラメータ
+
+    Returns:
+        dict: 再圧縮した画像（filter、data、width、height）。
+              小さくならなかった場合や、画像のデータが壊れていて読み込めなかった場合はNone
+
+    Note:
+        元の画像がJPEGでない場合は、縮小後にJPEGと可逆圧縮（Flate）の両方を試し、小さいほうを使用します。
+        1つの画像の失敗で文書全体の最適化が失敗しないよう、読み込めない画像（データの不足、
+        デコードできないJPEG、展開後のサイズが大きすぎる画像など）は元のまま残します。
+    """
+    import zlib
+
+    from PIL import Image
+
+    mode = 'L' if job['components'] == 1 else 'RGB'
+    try:
+        data = job['data']
+        for name in job['filters']:
+            if name == '/DCTDecode':
+                break
+            data = decode_filter(name, data)
+
+        if job['filters'][-1:] == ['/DCTDecode']:
+            image = Image.open(io.BytesIO(data))
+            if image.mode != mode:
+                if image.mode not in ('L', 'RGB'):
+                    return None
+                image = image.convert(mode)
+        else:
+            image = Image.frombytes(mode, (job['width'], job['height']), data)
+
+        image = image.resize((job['target_width'], job['target_height']), Image.LANCZOS)
+        output = io.BytesIO()
+        image.save(output, 'JPEG', quality=job['quality'], optimize=True)
+        candidates = [('/DCTDecode', output.getvalue())]
+        if job['filters'][-1:] != ['/DCTDecode']:
+            # 文字や線が中心の画像は、縮小して可逆圧縮したほうが小さくなる場合がある
+            candidates.append(('/FlateDecode', zlib.compress(image.tobytes(), 9)))
+    except Exception:
+        return None
+
+    name, data = min(candidates, key=lambda candidate: len(candidate[1]))
+    if len(data) >= len(job['data']):
+        return None
+    return {'filter': name, 'data': data, 'width': image.width, 'height': image.height}
+
+def collect_images(reader):
+    """
+    各ページで使用されている画像と、その見積もり解像度を集める関数
+
+    Args:
+        reader (PdfReader): 対象のPDF
+
+    Returns:
+        dict: (オブジェクト番号, 世代番号) → (画像の XObject, 見積もり解像度の最大値)
+
+    Note:
+        フォーム XObject の中で使用されている画像も対象にします。
+        複数のページで使用されている画像は、最も高い解像度の見積もりを使用します。
+    """
+    from PyPDF2.generic import IndirectObject
+
+    images = {}
+
+    def visit(resources, page_sides, seen):
+        xobjects = resources.get_object().get('/XObject') if resources is not None else None
+        if xobjects is None:
+            return
+        for ref in xobjects.get_object().values():
+            if not isinstance(ref, IndirectObject):
+                continue
+            key = (ref.idnum, ref.generation)
+            if key in seen:
+                continue
+            seen.add(key)
+            xobject = ref.get_object()
+            if xobject.get('/Subtype') == '/Form':
+                visit(xobject.get('/Resources'), page_sides, seen)
+            elif xobject.get('/Subtype') == '/Image':
+                image_sides = sorted((int(xobject['/Width']), int(xobject['/Height'])))
+                dpi = max(pixels / inches for pixels, inches in zip(image_sides, page_sides))
+                if key not in images or images[key][1] < dpi:
+                    images[key] = (xobject, dpi)
+
+    for page in reader.pages:
+        page_sides = sorted((float(page.mediabox.width) / 72, float(page.mediabox.height) / 72))
+        if min(page_sides) <= 0:
+            continue
+        visit(page.get('/Resources'), page_sides, set())
+    return images
+
+def content_data(page):
+    """
+    ページのコンテンツストリームを展開したデータを返す関数
+
+    Args:
+        page (PageObject): 対象のページ
+
+    Returns:
+        bytes: コンテンツストリームのデータ（複数のストリームの場合は連結したもの）
+    """
+    from PyPDF2.generic import ArrayObject
+
+    contents = page.get_contents()
+    if contents is None:
+        return b''
+    if isinstance(contents, ArrayObject):
+        return b'\n'.join(stream.get_object().get_data() for stream in contents)
+    return contents.get_data()
+
+def remove_unused_xobjects(page):
+    """
+    ページのコンテンツで使用されていない画像・フォームをページのリソースから削除する関数
+
+    Args:
+        page (PageObject): 対象のページ
+
+    Note:
+        リソースは複数のページで共有されている場合があるため、変更する場合は
+        ページ専用のリソースを作成します。
+    """
+    from PyPDF2.generic import DictionaryObject, NameObject
+
+    resources = page.get('/Resources')
+    resources = resources.get_object() if resources is not None else None
+    xobjects = resources.get('/XObject') if resources is not None else None
+    if xobjects is None:
+        return
+    xobjects = xobjects.get_object()
+
+    used = set(XOBJECT_DO_PATTERN.findall(content_data(page)))
+    # 名前にエスケープ（#xx）を含む場合は判定できないため残す
+    unused = [name for name in xobjects
+              if '#' not in name and name[1:].encode('latin-1', 'replace') not in used]
+    if not unused:
+        return
+
+    page_resources = DictionaryObject(resources)
+    page_resources[NameObject('/XObject')] = DictionaryObject(
+        {NameObject(name): value for name, value in xobjects.items() if name not in unused}
+    )
+    page[NameObject('/Resources')] = page_resources
+
+def remove_ascii_filters(stream):
+    """
+    ストリームの先頭の ASCII85Decode・ASCIIHexDecode を展開してバイナリのまま保存する関数
+
+    Args:
+        stream (StreamObject): 対象のストリーム
+
+    Note:
+        ASCII 形式の符号化はデータを 25-100% 大きくするだけで、圧縮の効果はありません。
+    """
+    from PyPDF2.generic import ArrayObject, NameObject
+
+    filters = stream.get('/Filter')
+    filters = filters.get_object() if filters is not None else []
+    filters = list(filters) if isinstance(filters, list) else [filters]
+    parms = stream.get('/DecodeParms')
+    parms = parms.get_object() if parms is not None else None
+
+    while filters and filters[0] in ASCII_FILTERS:
+        stream._data = decode_filter(filters.pop(0), stream._data)
+        if isinstance(parms, list):
+            parms = parms[1:]
+
+    if not filters:
+        stream.pop('/Filter', None)
+        stream.pop('/DecodeParms', None)
+        return
+    stream[NameObject('/Filter')] = filters[0] if len(filters) == 1 else ArrayObject(filters)
+    if isinstance(parms, list):
+        if len(parms) == 1:
+            stream[NameObject('/DecodeParms')] = parms[0]
+        else:
+            stream[NameObject('/DecodeParms')] = ArrayObject(parms)
+
+def optimize_document(reader, target_dpi=DEFAULT_TARGET_DPI, quality=DEFAULT_JPEG_QUALITY, executor=None):
+    """
+    PDFのサイズを最適化する関数
+
+    Args:
+        reader (PdfReader): 元のPDF
+        target_dpi (int): 目標の解像度（これを超える画像を縮小します）
+        quality (int): 再圧縮時のJPEG品質（1-95）
+        executor (Executor): 画像の再圧縮に使用するプロセスプール（Noneの場合はこのプロセスで順に処理）
+
+    Returns:
+        PdfWriter: 最適化後のPDF（メタデータは元のPDFから引き継ぎます）
+
+    Raises:
+        ValueError: 目標の解像度またはJPEG品質が範囲外の場合
+    """
+    from PyPDF2 import PdfWriter
+    from PyPDF2.generic import NameObject, NumberObject, StreamObject
+
+    if target_dpi <= 0:
+        raise ValueError('目標の解像度は1以上で指定してください')
+    if not 1 <= quality <= 95:
+        raise ValueError('JPEG品質は1から95の範囲で指定してください')
+
+    images = collect_images(reader)
+    jobs = {}
+    for key, (image, dpi) in images.items():
+        job = image_job(image, dpi, target_dpi, quality) if dpi > target_dpi else None
+        if job is None:
+            remove_ascii_filters(image)
+        else:
+            jobs[key] = (image, job)
+
+    keys = list(jobs)
+    if executor is None:
+        results = map(recompress_image, (jobs[key][1] for key in keys))
+    else:
+        results = executor.map(recompress_image, [jobs[key][1] for key in keys])
+
+    for key, result in zip(keys, results):
+        if result is None:
+            remove_ascii_filters(jobs[key][0])
+            continue
+        image = jobs[key][0]
+        image._data = result['data']
+        image[NameObject('/Filter')] = NameObject(result['filter'])
+        image[NameObject('/Width')] = NumberObject(result['width'])
+        image[NameObject('/Height')] = NumberObject(result['height'])
+        image.pop('/DecodeParms', None)
+
+    writer = PdfWriter()
+    for page in reader.pages:
+        remove_unused_xobjects(page)
+        contents = page.get_contents()
+        if isinstance(contents, StreamObject):
+            remove_ascii_filters(contents)
+            if '/Filter' not in contents:
+                page[NameObject('/Contents')] = contents.flate_encode()
+        writer.add_page(page)
+
+    if reader.metadata:
+        writer.add_metadata(dict(reader.metadata))
+    return writer
@@ -0,0 +1,185 @@
+"""
+処理結果のキャッシュ
+
+同じファイルに同じ処理を繰り返した場合（同じPDFをもう一度回転する、結合結果を再ダウンロードするなど）に、
+前回の処理結果をそのまま返すためのキャッシュです。
+
+キャッシュキーは次の組み合わせから計算します：
+- エンドポイント名
+- フォームのパラメータ（split_pages、rotation、insert_position など。前後の空白は無視）
+- アップロードされたファイルのフィールド名、ファイル名、内容のSHA-256
+
+処理結果はディスク上に保存し、合計サイズが上限を超えた場合は最も長く使われていないものから削除します（LRU）。
+処理結果の内容のSHA-256を強いETagとして使用します。
+"""
+
+import hashlib
+import json
+import os
+import time
+import uuid
+
+from flask import request
+
+from storage import RESULT_CACHE_FOLDER
+
+# アップロードファイルのハッシュ計算時の読み込み単位
+HASH_BUFFER_SIZE = 1024 * 1024
+
+def cache_budget():
+    """
+    キャッシュの合計サイズの上限を返す関数
+
+    Returns:
+        int: 上限のバイト数（0 の場合はキャッシュを使用しない）
+
+    Note:
+        上限は環境変数 RESULT_CACHE_MAX_BYTES（デフォルト: 256MB）で指定します。
+    """
+    return int(os.environ.get('RESULT_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+
+def file_digest(file):
+    """
+    アップロードされたファイルの内容のSHA-256を計算する関数
+
+    Args:
+        file: アップロードされたファイルオブジェクト
+
+    Returns:
+        str: SHA-256（16進数）
+    """
+    digest = hashlib.sha256()
+    file.seek(0)
+    while True:
+        block = file.read(HASH_BUFFER_SIZE)
+        if not block:
+            break
+        digest.update(block)
+    file.seek(0)
+    return digest.hexdigest()
+
+def request_cache_key():
+    """
+    現在のリクエストのキャッシュキーを計算する関数
+
+    Returns:
+        str: キャッシュキー（SHA-256の16進数）
+
+    Note:
+        files[] のように同じフィールドに複数のファイルがある場合は、送信された順序もキーに含めます。
+    """
+    form = sorted((name, [value.strip() for value in values])
+                  for name, values in request.form.lists())
+    files = sorted((name, [(file.filename, file_digest(file)) for file in values])
+                   for name, values in request.files.lists())
+    source = json.dumps([request.endpoint, form, files], ensure_ascii=False)
+    return hashlib.sha256(source.encode('utf-8')).hexdigest()
+
+def find_result(key):
+    """
+    キャッシュされた処理結果を探す関数
+
+    Args:
+        key (str): キャッシュキー
+
+    Returns:
+        tuple: (PDFファイルの絶対パス, ダウンロード時のファイル名, ETag, 追加のレスポンスヘッダー)
+               見つからない場合はNone
+    """
+    path = os.path.abspath(os.path.join(RESULT_CACHE_FOLDER, f'{key}.pdf'))
+    try:
+        with open(os.path.join(RESULT_CACHE_FOLDER, f'{key}.json'), encoding='utf-8') as f:
+            meta = json.load(f)
+        # 最終使用時刻を更新（LRUでの削除順に使用）
+        os.utime(path)
+    except (OSError, ValueError):
+        return None
+    return path, meta['download_name'], meta['etag'], meta.get('headers', {})
+
+def store_result(key, output, download_name, headers=None):
+    """
+    処理結果をキャッシュに保存する関数
+
+    Args:
+        key (str): キャッシュキー
+        output: 処理結果のPDF（io.BytesIO または一時ファイル）
+        download_name (str): ダウンロード時のファイル名
+        headers (dict): 処理結果と一緒に返すレスポンスヘッダー（任意）
+
+    Returns:
+        tuple: find_result と同じ (PDFファイルの絶対パス, ダウンロード時のファイル名, ETag, 追加のレスポンスヘッダー)
+               上限を超えるため保存しなかった場合はNone
+
+    Note:
+        複数のワーカーが同時に保存しても壊れたファイルが見えないよう、
+        一時ファイルに書き込んでから置き換えます。
+    """
+    budget = cache_budget()
+    size = output.seek(0, os.SEEK_END)
+    output.seek(0)
+    if size > budget:
+        return None
+
+    os.makedirs(RESULT_CACHE_FOLDER, exist_ok=True)
+    digest = hashlib.sha256()
+    path = os.path.join(RESULT_CACHE_FOLDER, f'{key}.pdf')
+    temp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+    try:
+        with open(temp_path, 'wb') as f:
+            while True:
+                block = output.read(HASH_BUFFER_SIZE)
+                if not block:
+                    break
+                digest.update(block)
+                f.write(block)
+        os.replace(temp_path, path)
+    finally:
+        output.seek(0)
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    etag = digest.hexdigest()
+
+    with open(os.path.join(RESULT_CACHE_FOLDER, f'{key}.json'), 'w', encoding='utf-8') as f:
+        json.dump({'download_name': download_name, 'etag': etag, 'headers': headers or {}}, f, ensure_ascii=False)
+
+    evict_results(budget)
+    return os.path.abspath(path), download_name, etag, headers or {}
+
+def evict_results(budget):
+    """
+    キャッシュの合計サイズが上限以下になるまで、古い処理結果から削除する関数
+
+    Args:
+        budget (int): 上限のバイト数
+    """
+    entries = []
+    for name in os.listdir(RESULT_CACHE_FOLDER):
+        if not name.endswith('.pdf'):
+            continue
+        try:
+            stat = os.stat(os.path.join(RESULT_CACHE_FOLDER, name))
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, name))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, name in sorted(entries):
+        if total <= budget:
+            break
+        key = name[:-len('.pdf')]
+        for path in (f'{key}.json', name):
+            try:
+                os.remove(os.path.join(RESULT_CACHE_FOLDER, path))
+            except OSError:
+                pass
+        total -= size
+
+    # 書き込み途中で異常終了した一時ファイルを削除
+    now = time.time()
+    for name in os.listdir(RESULT_CACHE_FOLDER):
+        path = os.path.join(RESULT_CACHE_FOLDER, name)
+        try:
+            if name.endswith('.tmp') and now - os.path.getmtime(path) > 60 * 60:
+                os.remove(path)
+        except OSError:
+            continue
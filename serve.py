@@ -0,0 +1,168 @@
+"""
+PDF処理ツールキット 本番用サーバー起動スクリプト
+
+Flask の開発サーバーの代わりに、Gunicorn（WSGIサーバー）上でアプリケーションを
+マルチプロセス（pre-fork）で実行します。
+
+特徴：
+- マスタープロセスで PyPDF2 / ReportLab / PIL を読み込んでからワーカーをforkするため、
+  ライブラリのメモリページがワーカー間で共有されます（copy-on-write）
+- ワーカー数・スレッド数・リクエストタイムアウトを指定可能
+- 処理中のリクエストを完了させてからのグレースフルな再起動・新しいコードへの入れ替え
+- 一定リクエスト数ごとのワーカー再起動（PyPDF2 によるメモリ増加の抑制）
+
+使用例：
+    python serve.py --workers 4 --threads 2 --timeout 120 --max-requests 500
+
+    # 新しいコードへの入れ替え（新しいマスターを起動し、古いワーカー・マスターを順に停止）
+    kill -USR2 $(cat sunflower.pid)
+    kill -WINCH $(cat sunflower.pid.oldbin)
+    kill -QUIT $(cat sunflower.pid.oldbin)
+
+    # --no-preload で起動した場合は、SIGHUP でワーカーが新しいコードを読み込みます
+    kill -HUP $(cat sunflower.pid)
+
+Note:
+    既定（--preload）ではマスタープロセスでアプリケーションを読み込むため、SIGHUP では
+    読み込み済みのコードのままワーカーが入れ替わるだけで、変更したコードは反映されません。
+
+各オプションは環境変数（.env ファイルも可）でも指定できます。
+"""
+
+import multiprocessing
+import os
+
+import click
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def default_workers():
+    """
+    デフォルトのワーカー数を返す関数
+
+    Returns:
+        int: CPUコア数 × 2 + 1（Gunicorn の推奨値）
+    """
+    return multiprocessing.cpu_count() * 2 + 1
+
+
+def build_options(bind, workers, threads, timeout, graceful_timeout,
+                  max_requests, max_requests_jitter, pidfile, log_level, preload=True):
+    """
+    Gunicorn の設定値を組み立てる関数
+
+    Args:
+        bind (str): 待ち受けアドレス（例: 0.0.0.0:8000）
+        workers (int): ワーカープロセス数
+        threads (int): ワーカーあたりのスレッド数
+        timeout (int): リクエストタイムアウト（秒）
+        graceful_timeout (int): リロード・停止時に処理中リクエストを待つ時間（秒）
+        max_requests (int): ワーカーを再起動するまでのリクエスト数（0で無効）
+        max_requests_jitter (int): 再起動タイミングを分散させるためのランダム幅
+        pidfile (str): マスタープロセスのPIDファイルパス（Noneで作成しない）
+        log_level (str): ログレベル
+        preload (bool): Trueの場合、マスターでアプリを読み込んでからforkする
+                        （Falseの場合は各ワーカーで読み込み、SIGHUP で新しいコードを読み込めます）
+
+    Returns:
+        dict: Gunicorn の設定辞書
+    """
+    options = {
+        'bind': bind,
+        'workers': workers,
+        'threads': threads,
+        # スレッドを使う場合は gthread ワーカーを使用
+        'worker_class': 'gthread' if threads > 1 else 'sync',
+        'timeout': timeout,
+        'graceful_timeout': graceful_timeout,
+        'max_requests': max_requests,
+        'max_requests_jitter': max_requests_jitter,
+        # マスターでアプリを読み込んでからforkする（メモリページの共有）
+        'preload_app': preload,
+        'loglevel': log_level,
+        'accesslog': '-',
+        'errorlog': '-',
+    }
+    if pidfile:
+        options['pidfile'] = pidfile
+    return options
+
+
+@click.command()
+@click.option('--bind', '-b', default=lambda: os.environ.get('SUNFLOWER_BIND', '0.0.0.0:8000'),
+              show_default='0.0.0.0:8000', help='待ち受けアドレス')
+@click.option('--workers', '-w', type=int,
+              default=lambda: int(os.environ.get('SUNFLOWER_WORKERS', default_workers())),
+              show_default='CPUコア数×2+1', help='ワーカープロセス数')
+@click.option('--threads', '-t', type=int,
+              default=lambda: int(os.environ.get('SUNFLOWER_THREADS', 1)),
+              show_default=1, help='ワーカーあたりのスレッド数')
+@click.option('--timeout', type=int,
+              default=lambda: int(os.environ.get('SUNFLOWER_TIMEOUT', 120)),
+              show_default=120, help='リクエストタイムアウト（秒）')
+@click.option('--graceful-timeout', type=int,
+              default=lambda: int(os.environ.get('SUNFLOWER_GRACEFUL_TIMEOUT', 30)),
+              show_default=30, help='グレースフルリロード・停止時の待機時間（秒）')
+@click.option('--max-requests', type=int,
+              default=lambda: int(os.environ.get('SUNFLOWER_MAX_REQUESTS', 500)),
+              show_default=500, help='ワーカーを再起動するまでのリクエスト数（0で無効）')
+@click.option('--max-requests-jitter', type=int,
+              default=lambda: int(os.environ.get('SUNFLOWER_MAX_REQUESTS_JITTER', 50)),
+              show_default=50, help='再起動タイミングのランダム幅')
+@click.option('--pidfile', default=lambda: os.environ.get('SUNFLOWER_PIDFILE', 'sunflower.pid'),
+              show_default='sunflower.pid', help='PIDファイル（シグナルでの再起動・コードの入れ替えに使用）')
+@click.option('--preload/--no-preload',
+              default=lambda: os.environ.get('SUNFLOWER_PRELOAD', '1').lower() not in ('0', 'false', 'off'),
+              show_default='preload',
+              help='マスターでアプリを読み込んでからforkする（--no-preload の場合は SIGHUP でコードを再読み込み）')
+@click.option('--log-level', default=lambda: os.environ.get('SUNFLOWER_LOG_LEVEL', 'info'),
+              show_default='info', help='ログレベル')
+def serve(bind, workers, threads, timeout, graceful_timeout,
+          max_requests, max_requests_jitter, pidfile, preload, log_level):
+    """
+    PDF処理ツールキットを本番用WSGIサーバーで起動する
+    """
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        raise click.ClickException(
+            'gunicorn がインストールされていません。"pip install gunicorn" を実行してください'
+            '（Windows では利用できません）。'
+        )
+
+    if workers < 1 or threads < 1:
+        raise click.BadParameter('ワーカー数とスレッド数は1以上を指定してください')
+
+    options = build_options(bind, workers, threads, timeout, graceful_timeout,
+                            max_requests, max_requests_jitter, pidfile, log_level, preload)
+
+    class StandaloneApplication(BaseApplication):
+        """
+        Gunicorn をプログラムから起動するためのアプリケーションクラス
+        """
+
+        def __init__(self, options):
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                if key in self.cfg.settings and value is not None:
+                    self.cfg.set(key.lower(), value)
+
+        def load(self):
+            # preload_app=True の場合はfork前のマスタープロセスで一度だけ、
+            # False の場合は各ワーカーの起動時に呼ばれる
+            from app import create_app, preload_libraries
+            preload_libraries()
+            return create_app()
+
+    click.echo(f'🌻 {bind} で起動します（workers={workers}, threads={threads}, '
+               f'timeout={timeout}s, max_requests={max_requests}）')
+    StandaloneApplication(options).run()
+
+
+if __name__ == '__main__':
+    serve()
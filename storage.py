@@ -0,0 +1,223 @@
+"""
+ファイル保存先の管理
+
+アップロードされたファイルや処理結果など、サーバー上に保存するファイルの保存先を
+まとめたモジュールです。保存先のフォルダは最初に使用した時点で作成されます。
+"""
+
+import json
+import os
+import re
+import shutil
+import time
+import uuid
+
+# アップロードされたファイルの保存先（プレビュー用に一定時間保持されます）
+UPLOAD_FOLDER = 'uploads'
+
+# 処理結果の保存先（プレビュー・ダウンロード用に一定時間保持されます）
+OUTPUT_FOLDER = 'outputs'
+
+# 処理結果のキャッシュの保存先（同じ入力・同じ処理の再実行時に再利用されます）
+RESULT_CACHE_FOLDER = 'result_cache'
+
+# アップロード・処理結果のIDとして受け付ける形式（パストラバーサル対策）
+DOCUMENT_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+# アップロードされたファイルの保存時のファイル名の形式
+UPLOAD_NAME_PATTERN = re.compile(r'^[0-9a-f]{32}\.pdf$')
+
+def ensure_upload_folder():
+    """
+    アップロードフォルダが存在しない場合に作成する関数
+
+    Returns:
+        str: アップロードフォルダのパス
+    """
+    os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+    return UPLOAD_FOLDER
+
+def ensure_output_folder():
+    """
+    処理結果フォルダが存在しない場合に作成する関数
+
+    Returns:
+        str: 処理結果フォルダのパス
+    """
+    os.makedirs(OUTPUT_FOLDER, exist_ok=True)
+    return OUTPUT_FOLDER
+
+def save_upload(file):
+    """
+    アップロードされたPDFを保存する関数
+
+    Args:
+        file: アップロードされたファイルオブジェクト
+
+    Returns:
+        str: 保存したアップロードのID
+
+    Note:
+        ファイル名はアップロード時の名前ではなく、推測できないランダムなIDにします。
+        保存のたびに、有効期限を過ぎたアップロードを削除します。
+    """
+    remove_expired_uploads()
+
+    upload_id = uuid.uuid4().hex
+    file.seek(0)
+    with open(os.path.join(ensure_upload_folder(), f'{upload_id}.pdf'), 'wb') as f:
+        shutil.copyfileobj(file, f)
+    file.seek(0)
+    return upload_id
+
+def move_upload(path):
+    """
+    サーバー上で組み立てたPDFをアップロードとして保存する関数
+
+    Args:
+        path (str): 移動するPDFファイルのパス（アップロードフォルダと同じファイルシステム上にあること）
+
+    Returns:
+        str: 保存したアップロードのID
+    """
+    remove_expired_uploads()
+
+    upload_id = uuid.uuid4().hex
+    os.replace(path, os.path.join(ensure_upload_folder(), f'{upload_id}.pdf'))
+    return upload_id
+
+def find_upload(upload_id):
+    """
+    保存済みのアップロードを探す関数
+
+    Args:
+        upload_id (str): アップロードのID
+
+    Returns:
+        str: PDFファイルの絶対パス（見つからない場合や有効期限を過ぎている場合はNone）
+    """
+    if not DOCUMENT_ID_PATTERN.match(upload_id):
+        return None
+    path = os.path.abspath(os.path.join(UPLOAD_FOLDER, f'{upload_id}.pdf'))
+    try:
+        if time.time() - os.path.getmtime(path) > upload_ttl():
+            return None
+    except OSError:
+        return None
+    return path
+
+def upload_ttl():
+    """
+    アップロードの有効期限を返す関数
+
+    Returns:
+        int: 有効期限（秒）
+
+    Note:
+        有効期限は環境変数 UPLOAD_TTL（秒、デフォルト: 3600）で指定します。
+    """
+    return int(os.environ.get('UPLOAD_TTL', 60 * 60))
+
+def remove_expired_uploads():
+    """
+    有効期限を過ぎたアップロードを削除する関数
+
+    Note:
+        チャンクや作業用のコピーなど、アップロードフォルダ内のサブフォルダは対象外です。
+    """
+    if not os.path.isdir(UPLOAD_FOLDER):
+        return
+    ttl = upload_ttl()
+    now = time.time()
+    for name in os.listdir(UPLOAD_FOLDER):
+        if not UPLOAD_NAME_PATTERN.match(name):
+            continue
+        path = os.path.join(UPLOAD_FOLDER, name)
+        try:
+            if now - os.path.getmtime(path) > ttl:
+                os.remove(path)
+        except OSError:
+            continue
+
+def save_output(output, download_name):
+    """
+    処理結果のPDFを保存する関数
+
+    Args:
+        output: 処理結果のバイナリデータ（ファイルオブジェクト）
+        download_name (str): ダウンロード時のファイル名
+
+    Returns:
+        str: 保存した処理結果のID
+
+    Note:
+        保存のたびに、有効期限を過ぎた処理結果を削除します。
+    """
+    remove_expired_outputs()
+
+    document_id = uuid.uuid4().hex
+    path = os.path.join(ensure_output_folder(), document_id)
+    os.makedirs(path)
+
+    with open(os.path.join(path, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump({'download_name': download_name}, f, ensure_ascii=False)
+
+    output.seek(0)
+    with open(os.path.join(path, 'document.pdf'), 'wb') as f:
+        shutil.copyfileobj(output, f)
+    output.seek(0)
+    return document_id
+
+def find_output(document_id):
+    """
+    保存済みの処理結果を探す関数
+
+    Args:
+        document_id (str): 処理結果のID
+
+    Returns:
+        tuple: (PDFファイルの絶対パス, ダウンロード時のファイル名)
+               見つからない場合や有効期限を過ぎている場合はNone
+    """
+    if not DOCUMENT_ID_PATTERN.match(document_id):
+        return None
+    path = os.path.abspath(os.path.join(OUTPUT_FOLDER, document_id))
+    if not os.path.exists(os.path.join(path, 'document.pdf')):
+        return None
+    try:
+        if time.time() - os.path.getmtime(path) > output_ttl():
+            return None
+    except OSError:
+        return None
+    with open(os.path.join(path, 'meta.json'), encoding='utf-8') as f:
+        meta = json.load(f)
+    return os.path.join(path, 'document.pdf'), meta['download_name']
+
+def output_ttl():
+    """
+    処理結果の有効期限を返す関数
+
+    Returns:
+        int: 有効期限（秒）
+
+    Note:
+        有効期限は環境変数 OUTPUT_TTL（秒、デフォルト: 3600）で指定します。
+    """
+    return int(os.environ.get('OUTPUT_TTL', 60 * 60))
+
+def remove_expired_outputs():
+    """
+    有効期限を過ぎた処理結果を削除する関数
+
+    """
+    if not os.path.isdir(OUTPUT_FOLDER):
+        return
+    ttl = output_ttl()
+    now = time.time()
+    for name in os.listdir(OUTPUT_FOLDER):
+        path = os.path.join(OUTPUT_FOLDER, name)
+        try:
+            if now - os.path.getmtime(path) > ttl:
+                shutil.rmtree(path, ignore_errors=True)
+        except OSError:
+            continue
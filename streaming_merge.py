@@ -0,0 +1,216 @@
+"""
+メモリ使用量を抑えたPDF結合（ストリーミング結合）
+
+PdfMerger はすべての元のPDFを開いたまま、最後にまとめて書き出すため、
+メモリ使用量が元のPDFの合計サイズに比例して増えます。
+
+ストリーミング結合では、元のPDFを1つずつ読み込み、そのページと参照されているオブジェクト
+（フォント、画像、コンテンツストリームなど）をすぐに出力ファイルへ書き込んでから、
+そのPDFを解放します。最後にページツリー、カタログ、相互参照表（xref）を書き込みます。
+そのため、メモリ使用量は最も大きい1つのPDFの大きさで決まります（毎月の800ファイルの結合などに使用）。
+
+Note:
+    しおり（アウトライン）、フォーム、構造ツリーなど文書全体に属する情報は引き継がれません。
+    ページ内のリンクや注釈は引き継がれます。
+"""
+
+import tempfile
+
+from pdf_operations import rewrite_pdf
+
+class StreamingMerger:
+    """
+    元のPDFを1つずつ出力ファイルに書き込んでいくPDF結合
+
+    Args:
+        output: 出力先（書き込み可能なファイルオブジェクト。tell() が使用できること）
+
+    使用例：
+        merger = StreamingMerger(output)
+        for path in paths:
+            merger.append(path)
+        merger.close()
+    """
+
+    # オブジェクト番号1はカタログ、2はページツリーのルート（最後に書き込む）
+    CATALOG_NUMBER = 1
+    PAGES_NUMBER = 2
+
+    def __init__(self, output):
+        self.output = output
+        self.offsets = {}
+        self.next_number = self.PAGES_NUMBER + 1
+        self.page_numbers = []
+        # バイナリを含むファイルであることを示すコメント行を含むヘッダー
+        self.output.write(b'%PDF-1.7\n%\xe2\xe3\xcf\xd3\n')
+
+    def allocate(self):
+        """
+        新しいオブジェクト番号を割り当てる関数
+
+        Returns:
+            int: オブジェクト番号
+        """
+        number = self.next_number
+        self.next_number += 1
+        return number
+
+    def write_object(self, number, obj):
+        """
+        間接オブジェクトを出力ファイルに書き込む関数
+
+        Args:
+            number (int): オブジェクト番号
+            obj: 書き込むオブジェクト（参照は出力側の番号に置き換え済みであること）
+        """
+        from PyPDF2.generic import NullObject
+
+        self.offsets[number] = self.output.tell()
+        self.output.write(f'{number} 0 obj\n'.encode('ascii'))
+        (NullObject() if obj is None else obj).write_to_stream(self.output, None)
+        self.output.write(b'\nendobj\n')
+
+    def append(self, source):
+        """
+        元のPDFのすべてのページを出力ファイルに書き込む関数
+
+        Args:
+            source: 元のPDF（ファイルオブジェクトまたはパス）
+
+        Returns:
+            int: 追加したページ数
+
+        Note:
+            この関数が終わった時点で、元のPDFの読み込み結果はすべて解放されます。
+        """
+        from PyPDF2 import PdfReader
+        from PyPDF2.generic import (
+            ArrayObject,
+            DictionaryObject,
+            IndirectObject,
+            NameObject,
+            StreamObject,
+        )
+
+        reader = PdfReader(source)
+        if reader.is_encrypted:
+            # パスワードなしで開けるPDF（所有者パスワードのみ）は復号して結合
+            reader.decrypt('')
+
+        # 元のオブジェクト番号 → 出力側のオブジェクト番号
+        numbers = {}
+        pending = []
+
+        def reference(ref):
+            key = (ref.idnum, ref.generation)
+            if key not in numbers:
+                numbers[key] = self.allocate()
+                pending.append(ref)
+            return IndirectObject(numbers[key], 0, None)
+
+        def remap(obj):
+            # 参照を出力側の番号に置き換えたコピーを作成（参照先はあとで書き込む）
+            if isinstance(obj, IndirectObject):
+                return reference(obj)
+            if isinstance(obj, StreamObject):
+                copy = type(obj)()
+                copy._data = obj._data
+                for key, value in obj.items():
+                    # /Length は書き込み時に再計算される
+                    if key != '/Length':
+                        copy[NameObject(key)] = remap(value)
+                return copy
+            if isinstance(obj, DictionaryObject):
+                return DictionaryObject({NameObject(key): remap(value) for key, value in obj.items()})
+            if isinstance(obj, ArrayObject):
+                return ArrayObject(remap(item) for item in obj)
+            return obj
+
+        # ページへの参照（リンクの移動先など）が新しいページを指すよう、先に番号を割り当てる
+        pages = []
+        for page in reader.pages:
+            number = self.allocate()
+            if page.indirect_ref is not None:
+                numbers[(page.indirect_ref.idnum, page.indirect_ref.generation)] = number
+            pages.append((number, page))
+
+        for number, page in pages:
+            # 継承された属性（/Resources、/MediaBox など）はページ自身に展開済み
+            page_copy = DictionaryObject({NameObject(key): remap(value)
+                                          for key, value in page.items() if key != '/Parent'})
+            page_copy[NameObject('/Parent')] = IndirectObject(self.PAGES_NUMBER, 0, None)
+            self.write_object(number, page_copy)
+            self.page_numbers.append(number)
+
+            # このページから参照されているオブジェクトを書き込む
+            while pending:
+                ref = pending.pop()
+                self.write_object(numbers[(ref.idnum, ref.generation)], remap(reader.get_object(ref)))
+
+        return len(pages)
+
+    def close(self):
+        """
+        ページツリー、カタログ、相互参照表を書き込んで出力を完成させる関数
+        """
+        from PyPDF2.generic import (
+            ArrayObject,
+            DictionaryObject,
+            IndirectObject,
+            NameObject,
+            NumberObject,
+        )
+
+        kids = ArrayObject(IndirectObject(number, 0, None) for number in self.page_numbers)
+        self.write_object(self.PAGES_NUMBER, DictionaryObject({
+            NameObject('/Type'): NameObject('/Pages'),
+            NameObject('/Kids'): kids,
+            NameObject('/Count'): NumberObject(len(self.page_numbers)),
+        }))
+        self.write_object(self.CATALOG_NUMBER, DictionaryObject({
+            NameObject('/Type'): NameObject('/Catalog'),
+            NameObject('/Pages'): IndirectObject(self.PAGES_NUMBER, 0, None),
+        }))
+
+        xref_offset = self.output.tell()
+        size = self.next_number
+        self.output.write(f'xref\n0 {size}\n'.encode('ascii'))
+        self.output.write(b'0000000000 65535 f \n')
+        for number in range(1, size):
+            if number in self.offsets:
+                self.output.write(f'{self.offsets[number]:010d} 00000 n \n'.encode('ascii'))
+            else:
+                self.output.write(b'0000000000 65535 f \n')
+        self.output.write(
+            f'trailer\n<< /Size {size} /Root {self.CATALOG_NUMBER} 0 R >>\n'
+            f'startxref\n{xref_offset}\n%%EOF\n'.encode('ascii')
+        )
+
+def stream_merge_documents(files, linearize=False, password=None):
+    """
+    複数のPDFをストリーミング結合で一時ファイルに書き出す関数
+
+    Args:
+        files (list): 結合するPDF（ファイルオブジェクトまたはパス）のリスト
+        linearize (bool): Trueの場合、線形化（高速Web表示）したPDFを書き出す
+        password (str): 指定した場合、このパスワードで暗号化したPDFを書き出す
+
+    Returns:
+        tuple: (先頭にシークされた一時ファイル, 結合したページ数)
+
+    Note:
+        出力は常に一時ファイルに書き出します。
+    """
+    output = tempfile.TemporaryFile()
+    merger = StreamingMerger(output)
+    page_count = 0
+    for file in files:
+        page_count += merger.append(file)
+    merger.close()
+    output.seek(0)
+
+    if linearize or password:
+        rewritten = rewrite_pdf(output, linearize=linearize, password=password, spool=True)
+        output.close()
+        return rewritten, page_count
+    return output, page_count